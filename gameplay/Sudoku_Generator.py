@@ -16,6 +16,10 @@ else:
 given_regex = re.compile('(?!0)')
 
 
+class GenerationCancelled(Exception):
+    """Raised when the cancel event passed into the generator is set mid-generation."""
+
+
 def check_for_givens(seq):
     return len([m.start() for m in given_regex.finditer(seq)])-1
 
@@ -159,13 +163,32 @@ def propagate_array(sudoku_array, N):
     #print('Propagate Complete')
 
 
-def generate_sudoku_grid(difficulty):
-    grid = generate_completed_grid(11)
+def check_unique_dig(grid, i):
+    """Check that digging the cell i out of the grid string keeps the solution unique,
+    i.e. no other digit in that cell leads to a solution."""
+    current_number = grid[i]
+    other_numbers = solver.digits.replace(current_number, '')
+    for digit in other_numbers:
+        grid_check = grid[:i] + digit + grid[i+1:]
+        if solver.solve(solver.parse_grid(grid_check)):
+            return False
+    return True
+
+
+def generate_sudoku_grid(difficulty, cancel=None):
+    return generate_sudoku_grid_with_solution(difficulty, cancel)[0]
+
+
+def generate_sudoku_grid_with_solution(difficulty, cancel=None):
+    """Dig a puzzle out of a completed grid, returning the puzzle and the completed grid as strings."""
+    solution = grid = generate_completed_grid(11)
     n_givens, lower_bound = specify_grid_properties(difficulty)
     dig_sequence = generate_dig_sequence(difficulty)
     holes = 0
 
     while holes < 81-n_givens:
+        if cancel is not None and cancel.is_set():
+            raise GenerationCancelled()
         try:
             i = next(dig_sequence)
         except StopIteration:
@@ -175,29 +198,28 @@ def generate_sudoku_grid(difficulty):
         col = i % 9
         if check_for_givens(grid[row:row+9]) > lower_bound and\
                 check_for_givens(grid[col::9]) > lower_bound:
-            current_number = grid[i]
-            other_numbers = solver.digits.replace(current_number, '')
-            unique = True
-            for digit in other_numbers:
-                grid_check = grid[:i] + digit + grid[i+1:]
-                if solver.solve(solver.parse_grid(grid_check)):
-                    unique = False
-                    break
-            if unique:
+            if check_unique_dig(grid, i):
                 grid = grid[:i] + '0' + grid[i+1:]
                 holes += 1
 
-    return grid
+    return grid, solution
+
 
+def generate_sudoku_puzzle(difficulty, cancel=None):
+    return generate_sudoku_puzzle_with_solution(difficulty, cancel)[0]
 
-def generate_sudoku_puzzle(difficulty):
-    grid = generate_sudoku_grid(difficulty)
+
+def generate_sudoku_puzzle_with_solution(difficulty, cancel=None):
+    """Generate a puzzle and its solution as 9x9 arrays. Both go through the same propagation,
+    so the solution still matches the puzzle."""
+    grid, solution = generate_sudoku_grid_with_solution(difficulty, cancel)
     print('Difficulty level: ', difficulty, 'Givens: ', check_for_givens(grid))
-    sudoku_array = grid_to_array(grid)
-    propagate_array(sudoku_array, 18)
+    stacked = np.stack((grid_to_array(grid), grid_to_array(solution)), axis=-1)
+    propagate_array(stacked, 18)
+    sudoku_array = stacked[:, :, 0].copy()
     print("Warning: the solution to the puzzle may be non-unique.")
     print('Puzzle: ', array_to_grid(sudoku_array))
-    return sudoku_array
+    return sudoku_array, stacked[:, :, 1].copy()
 
 
 if __name__ == "__main__":
@@ -118,6 +118,32 @@ def search(values):
                 for d in values[s])
 
 
+def solve_grid(grid):
+    """Solve a grid string directly, returning the solved values or False."""
+    return search(parse_grid(grid))
+
+
+def count_solutions(values, limit=2):
+    """Count the solutions reachable from values, stopping once limit is reached.
+    With the default limit, a result of 1 means the solution is unique."""
+    if values is False:
+        return 0
+    if all(len(values[s]) == 1 for s in squares):
+        return 1
+    n, s = min((len(values[s]), s) for s in squares if len(values[s]) > 1)
+    count = 0
+    for d in values[s]:
+        count += count_solutions(assign(values.copy(), s, d), limit - count)
+        if count >= limit:
+            break
+    return count
+
+
+def has_unique_solution(grid):
+    """Check that a grid string has exactly one solution."""
+    return count_solutions(parse_grid(grid)) == 1
+
+
 def some(seq):
     """Return some element of seq that is true."""
     for e in seq:
@@ -0,0 +1,79 @@
+"""
+Awaitable wrappers around the puzzle generator and solver, so asyncio services can use them without
+blocking their event loop. All calls are dispatched to one shared thread pool of bounded size.
+
+Cancelling the awaiting task cancels the call if it has not started yet. A generation that is already
+running is stopped at its next dig step. Solving is fast enough that a running solve is left to finish.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from . import Sudoku_Generator as SdkGen
+from . import Sudoku_Solver as solver
+
+MAX_WORKERS = 4
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Get the shared executor, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='sudoku')
+        return _executor
+
+
+def configure_executor(max_workers):
+    """Replace the shared executor with one of a different size. Calls already submitted finish on the old one.
+
+    Parameters
+    ----------
+    max_workers: int
+        The maximum number of calls that run at the same time
+    """
+    global _executor
+    with _executor_lock:
+        old_executor = _executor
+        _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sudoku')
+    if old_executor is not None:
+        old_executor.shutdown(wait=False)
+
+
+async def _run(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), partial(func, *args))
+
+
+async def _run_cancellable(func, *args):
+    """Run func with a cancel event as its last argument, which is set if the awaiting task is cancelled."""
+    cancel = threading.Event()
+    try:
+        return await _run(func, *args, cancel)
+    except asyncio.CancelledError:
+        cancel.set()
+        raise
+
+
+async def generate_sudoku_puzzle(difficulty):
+    """Generate a puzzle of the given difficulty as a 9x9 array."""
+    return await _run_cancellable(SdkGen.generate_sudoku_puzzle, difficulty)
+
+
+async def solve(grid):
+    """Solve a grid string, returning the solved values or False if there is no solution."""
+    return await _run(solver.solve_grid, grid)
+
+
+async def has_unique_solution(grid):
+    """Check that a grid string has exactly one solution."""
+    return await _run(solver.has_unique_solution, grid)
+
+
+async def check_unique_dig(grid, i):
+    """Check that digging the cell i out of a solved grid string keeps the solution unique."""
+    return await _run(SdkGen.check_unique_dig, grid, i)
@@ -0,0 +1,228 @@
+"""
+Module that detects when the player's board (givens plus entries) can no longer be completed, even though no
+rule is broken yet.
+
+After each move, candidate propagation (naked and hidden singles on bitmasks) is run, seeded from the propagated
+state of the previous board when the move only fills a cell. This decides most boards within a frame. Boards
+that propagation cannot decide are passed to a bounded depth-first search on a worker thread.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import sudoku_gameplay as sdk
+
+ALIVE = 0
+DEAD = 1
+UNKNOWN = 2
+
+NODE_LIMIT = 20000
+
+PEERS = tuple(tuple(j for j in sdk.CELL_NEIGHBOURS[i] if j != i) for i in range(81))
+POPCOUNT = tuple(bin(mask).count('1') for mask in range(1 << 9))
+
+
+class SearchCancelled(Exception):
+    """Raised when a background search is cancelled because the board changed."""
+
+
+def initial_candidates(grid):
+    """Get the candidate masks of a board as a list, filled cells holding the bit of their digit"""
+    candidates = sdk.compute_candidates(grid).reshape(81).tolist()
+    for i, val in enumerate(grid.reshape(81).tolist()):
+        if val:
+            candidates[i] = 1 << (val - 1)
+    return candidates
+
+
+def propagate(candidates, queue):
+    """Apply naked and hidden singles to candidate masks in place until nothing changes.
+
+    Parameters
+    ----------
+    candidates: list
+        81 candidate masks
+    queue: list
+        Cells that were just reduced to one candidate, whose digit has not been removed from their peers yet
+
+    Returns
+    -------
+    int: DEAD if a contradiction was found, ALIVE if every cell is decided, UNKNOWN otherwise
+    """
+    while True:
+        while queue:
+            i = queue.pop()
+            bit = candidates[i]
+            for j in PEERS[i]:
+                mask = candidates[j]
+                if mask & bit:
+                    mask &= ~bit
+                    if not mask:
+                        return DEAD
+                    candidates[j] = mask
+                    if POPCOUNT[mask] == 1:
+                        queue.append(j)
+
+        for unit in sdk.UNIT_CELLS:
+            once = twice = 0
+            for j in unit:
+                mask = candidates[j]
+                twice |= once & mask
+                once |= mask
+            if once != sdk.ALL_DIGITS:
+                return DEAD
+            hidden = once & ~twice
+            if hidden:
+                for j in unit:
+                    mask = candidates[j]
+                    if mask & hidden and POPCOUNT[mask] > 1:
+                        mask &= hidden
+                        if POPCOUNT[mask] > 1:
+                            # Two digits can only go in this one cell
+                            return DEAD
+                        candidates[j] = mask
+                        queue.append(j)
+        if not queue:
+            break
+
+    if all(POPCOUNT[mask] == 1 for mask in candidates):
+        return ALIVE
+    return UNKNOWN
+
+
+def search(candidates, budget, cancel=None):
+    """Depth-first search for a completion of propagated candidate masks.
+
+    Parameters
+    ----------
+    candidates: list
+        81 propagated candidate masks
+    budget: list
+        A one element list holding the number of nodes left to visit
+    cancel: threading.Event
+        Checked at every node. The search raises SearchCancelled once it is set
+
+    Returns
+    -------
+    bool: True if a completion exists, False if none does, or None if the budget ran out
+    """
+    if cancel is not None and cancel.is_set():
+        raise SearchCancelled()
+    if budget[0] <= 0:
+        return None
+    budget[0] -= 1
+
+    n, i = min((POPCOUNT[mask], i) for i, mask in enumerate(candidates) if POPCOUNT[mask] > 1)
+    unknown = False
+    for d in sdk.SCRIBBLE_DIGITS[candidates[i]]:
+        branch = list(candidates)
+        branch[i] = 1 << (d - 1)
+        result = propagate(branch, [i])
+        if result == ALIVE:
+            return True
+        if result == UNKNOWN:
+            found = search(branch, budget, cancel)
+            if found:
+                return True
+            if found is None:
+                unknown = True
+    return None if unknown else False
+
+
+class DeadEndDetector:
+    """Checks the board after each move, deciding quickly by propagation and otherwise in the background.
+    """
+
+    def __init__(self, on_result=None, node_limit=NODE_LIMIT):
+        """
+        Parameters
+        ----------
+        on_result: callable
+            Called from the worker thread with the board key and ALIVE, DEAD or UNKNOWN once a background
+            search finishes
+        node_limit: int
+            Maximum number of nodes visited by a background search
+        """
+        self.on_result = on_result
+        self.node_limit = node_limit
+        self._seed = None
+        self._seed_key = None
+        self._cancel = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='deadend')
+
+    @staticmethod
+    def board_key(grid):
+        return grid.tobytes()
+
+    def reset(self):
+        """Forget the previous board, e.g. when a new puzzle is loaded"""
+        self._cancel_search()
+        self._seed = None
+        self._seed_key = None
+
+    def check(self, grid, row=None, col=None, prev_val=0):
+        """Check a board after a move, without waiting for a background search.
+
+        Parameters
+        ----------
+        grid: np.ndarray
+            The 9x9 number grid after the move
+        row, col: int
+            The cell that was changed, if known
+        prev_val: int
+            The digit the cell held before the move
+
+        Returns
+        -------
+        int: ALIVE or DEAD if propagation decided, UNKNOWN if a background search was started
+        """
+        self._cancel_search()
+        key = self.board_key(grid)
+
+        i = None if row is None else row * 9 + col
+        val = 0 if i is None else grid.item(row, col)
+        if (i is not None and prev_val == 0 and val and self._seed is not None
+                and self._seed_key == key[:i] + b'\x00' + key[i + 1:]):
+            # The move only filled a cell, so the previous deductions still hold
+            bit = 1 << (val - 1)
+            if not self._seed[i] & bit:
+                candidates = None
+                result = DEAD
+            else:
+                candidates = list(self._seed)
+                candidates[i] = bit
+                result = propagate(candidates, [i])
+        else:
+            candidates = initial_candidates(grid)
+            if any(mask == 0 for mask in candidates):
+                result = DEAD
+            else:
+                result = propagate(candidates, [j for j, mask in enumerate(candidates)
+                                                if POPCOUNT[mask] == 1])
+
+        if result == DEAD:
+            self._seed = None
+            self._seed_key = None
+            return DEAD
+        self._seed = candidates
+        self._seed_key = key
+        if result == UNKNOWN:
+            self._cancel = threading.Event()
+            self._executor.submit(self._search, list(candidates), key, self._cancel)
+        return result
+
+    def shutdown(self):
+        self._cancel_search()
+        self._executor.shutdown(wait=False)
+
+    def _cancel_search(self):
+        if self._cancel is not None:
+            self._cancel.set()
+            self._cancel = None
+
+    def _search(self, candidates, key, cancel):
+        try:
+            found = search(candidates, [self.node_limit], cancel)
+        except SearchCancelled:
+            return
+        if self.on_result is not None:
+            self.on_result(key, {True: ALIVE, False: DEAD, None: UNKNOWN}[found])
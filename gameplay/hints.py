@@ -0,0 +1,214 @@
+"""
+Module that finds the next logically deducible step from a board, for hints. The techniques are tried from
+the simplest: naked single, hidden single, then pointing pair. A pointing pair only removes candidates, so its
+eliminations are applied and the search for a single goes on, until a digit can be placed.
+
+The search runs on a worker thread through HintEngine, which restarts it whenever the board changes and keeps
+the results per board state, so asking for a hint never blocks the caller.
+"""
+import collections
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from . import sudoku_gameplay as sdk
+
+NAKED_SINGLE = 'Naked single'
+HIDDEN_SINGLE = 'Hidden single'
+SOLUTION_DIGIT = 'Solution digit'
+
+UNIT_NAMES = ['row'] * 9 + ['column'] * 9 + ['box'] * 9
+POPCOUNT = np.array([bin(mask).count('1') for mask in range(1 << 9)], dtype=np.uint8)
+
+CACHE_SIZE = 64
+
+# technique: one of the technique names
+# row, col: the cell to fill
+# digit: the digit placed
+# cells: the flat indices of the cells candidates were eliminated from by pointing pairs to reach the single
+Hint = collections.namedtuple('Hint', ['technique', 'row', 'col', 'digit', 'cells'])
+
+
+class HintCancelled(Exception):
+    """Raised when a hint search is cancelled because the board changed."""
+
+
+def describe_hint(hint):
+    """Get a sentence explaining a hint, for display"""
+    if hint is None:
+        return 'No simple deduction found from here'
+    if hint.technique == SOLUTION_DIGIT:
+        return 'Row {}, column {} should be {}'.format(hint.row + 1, hint.col + 1, hint.digit)
+    if hint.technique == NAKED_SINGLE:
+        text = 'Row {}, column {} can only be {}'.format(hint.row + 1, hint.col + 1, hint.digit)
+    else:
+        text = 'Only row {}, column {} can hold {} in its unit'.format(hint.row + 1, hint.col + 1, hint.digit)
+    if hint.cells:
+        text += ', once pointing pairs are removed from {} cells'.format(len(set(hint.cells)))
+    return text
+
+
+def _check(cancel):
+    if cancel is not None and cancel.is_set():
+        raise HintCancelled()
+
+
+def find_hint(grid, cancel=None):
+    """Find the next logical step from a board.
+
+    Parameters
+    ----------
+    grid: np.ndarray
+        The 9x9 number grid
+    cancel: threading.Event
+        Checked between techniques. The search raises HintCancelled once it is set
+
+    Returns
+    -------
+    Hint: The single found, or None if the board is stuck for these techniques or has a contradiction
+    """
+    candidates = sdk.compute_candidates(grid).reshape(81)
+    empty = grid.reshape(81) == 0
+    eliminated = ()
+    while True:
+        if np.any(empty & (candidates == 0)):
+            return None
+        hint = _find_single(candidates, empty)
+        if hint is not None:
+            return hint._replace(cells=eliminated)
+        _check(cancel)
+
+        pointing = _find_pointing_pair(candidates)
+        if pointing is None:
+            return None
+        digit, cells = pointing
+        candidates[list(cells)] &= 0x1ff ^ (1 << (digit - 1))
+        eliminated += cells
+        _check(cancel)
+
+
+def _find_single(candidates, empty):
+    # Naked single: an empty cell with exactly one candidate
+    singles = np.flatnonzero(empty & (POPCOUNT[candidates] == 1))
+    if len(singles):
+        i = int(singles[0])
+        return Hint(NAKED_SINGLE, i // 9, i % 9, sdk.SCRIBBLE_DIGITS[candidates[i]][0], ())
+
+    # Hidden single: a digit with exactly one possible cell in a unit
+    has_digit = (candidates[sdk.UNIT_CELLS_ARRAY][..., None] & sdk.DIGIT_BITS) > 0
+    units, digits = np.nonzero(has_digit.sum(axis=1) == 1)
+    if len(units):
+        u, d = int(units[0]), int(digits[0])
+        i = sdk.UNIT_CELLS[u][int(np.argmax(has_digit[u, :, d]))]
+        return Hint(HIDDEN_SINGLE, i // 9, i % 9, d + 1, ())
+    return None
+
+
+def _find_pointing_pair(candidates):
+    """Find a digit whose candidates within a box all lie on one line, so it can be eliminated from the rest of
+    that line.
+
+    Returns
+    -------
+    (int, tuple): The digit and the flat indices of the cells to eliminate it from, or None
+    """
+    for box in range(18, 27):
+        box_cells = sdk.UNIT_CELLS[box]
+        for d in range(9):
+            cells = [i for i in box_cells if candidates[i] & (1 << d)]
+            if len(cells) < 2:
+                continue
+            for line_of in (lambda i: i // 9, lambda i: 9 + i % 9):
+                line = line_of(cells[0])
+                if all(line_of(i) == line for i in cells):
+                    eliminated = tuple(i for i in sdk.UNIT_CELLS[line]
+                                       if i not in box_cells and candidates[i] & (1 << d))
+                    if eliminated:
+                        return d + 1, eliminated
+    return None
+
+
+def solution_hint(system):
+    """Get the digit of the first empty or wrong cell from the stored solution, when no deduction is found.
+
+    Returns
+    -------
+    Hint: The cell to fill, or None if the solution is unknown or the board already matches it
+    """
+    solution = system.solution.reshape(81)
+    cells = np.flatnonzero((solution > 0) & (system.number_grid.reshape(81) != solution))
+    if not len(cells):
+        return None
+    i = int(cells[0])
+    return Hint(SOLUTION_DIGIT, i // 9, i % 9, int(solution[i]), ())
+
+
+class HintEngine:
+    """Searches for hints in the background. Call board_changed whenever the board changes, and lookup when
+    the player asks for a hint.
+    """
+
+    def __init__(self, on_ready=None, cache_size=CACHE_SIZE):
+        """
+        Parameters
+        ----------
+        on_ready: callable
+            Called from the worker thread with the board key and the hint once a search finishes
+        cache_size: int
+            Number of board states to remember hints for
+        """
+        self.on_ready = on_ready
+        self.cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._cancel = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='hints')
+
+    @staticmethod
+    def board_key(grid):
+        return grid.tobytes()
+
+    def board_changed(self, grid):
+        """Cancel the running search and start one for the new board, unless its hint is already known"""
+        if self._cancel is not None:
+            self._cancel.set()
+            self._cancel = None
+        key = self.board_key(grid)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return
+        self._cancel = threading.Event()
+        self._executor.submit(self._search, grid.copy(), key, self._cancel)
+
+    def lookup(self, grid):
+        """Get the hint for a board without waiting.
+
+        Returns
+        -------
+        (bool, Hint): Whether the search for this board has finished, and its hint
+        """
+        with self._lock:
+            if self.board_key(grid) in self._cache:
+                return True, self._cache[self.board_key(grid)]
+        return False, None
+
+    def shutdown(self):
+        if self._cancel is not None:
+            self._cancel.set()
+        self._executor.shutdown(wait=False)
+
+    def _search(self, grid, key, cancel):
+        if cancel.is_set():
+            return
+        try:
+            hint = find_hint(grid, cancel)
+        except HintCancelled:
+            return
+        with self._lock:
+            self._cache[key] = hint
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        if self.on_ready is not None:
+            self.on_ready(key, hint)
@@ -0,0 +1,73 @@
+"""
+Module that keeps the undo/redo history of a Sudoku game as fixed-size delta records in a ring buffer,
+so memory stays the same no matter how many edits are made. Once full, the oldest records are dropped.
+"""
+import numpy as np
+
+JOURNAL_CAPACITY = 4096
+
+# Cell index (row * 9 + col), number before and after the edit, and the scribble mask of the other side
+# of the edit: the mask before it while it can be undone, the mask after it while it can be redone
+RECORD_DTYPE = np.dtype([('cell', np.uint8), ('old', np.uint8), ('new', np.uint8), ('mask', np.uint16)])
+
+
+class MoveJournal:
+
+    def __init__(self, capacity=JOURNAL_CAPACITY):
+        self.records = np.zeros(capacity, dtype=RECORD_DTYPE)
+        self.capacity = capacity
+        self.start = 0
+        self.undoable = 0
+        self.redoable = 0
+
+    def clear(self):
+        self.start = 0
+        self.undoable = 0
+        self.redoable = 0
+
+    def record(self, cell, old, new, mask):
+        """Add an edit, discarding anything that could be redone"""
+        pos = (self.start + self.undoable) % self.capacity
+        self.records[pos] = (cell, old, new, mask)
+        if self.undoable == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+        else:
+            self.undoable += 1
+        self.redoable = 0
+
+    def undo(self):
+        """Step back one edit.
+
+        Returns
+        -------
+        int: The position of the record to undo, or -1 if there is nothing to undo
+        """
+        if not self.undoable:
+            return -1
+        self.undoable -= 1
+        self.redoable += 1
+        return (self.start + self.undoable) % self.capacity
+
+    def redo(self):
+        """Step forward one edit.
+
+        Returns
+        -------
+        int: The position of the record to redo, or -1 if there is nothing to redo
+        """
+        if not self.redoable:
+            return -1
+        pos = (self.start + self.undoable) % self.capacity
+        self.undoable += 1
+        self.redoable -= 1
+        return pos
+
+    def get(self, pos):
+        """Get the (cell, old, new, mask) of a record"""
+        return self.records.item(pos)
+
+    def swap_mask(self, pos, mask):
+        """Store a scribble mask in a record, returning the one it held"""
+        old_mask = self.records.item(pos)[3]
+        self.records['mask'][pos] = mask
+        return old_mask
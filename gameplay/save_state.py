@@ -0,0 +1,167 @@
+"""
+Module that saves and restores a game in progress, using a compact versioned binary format:
+
+    header      magic b'SDKG', format version, difficulty (8 bytes)
+    clock       elapsed time in tenths of a second (uint32)
+    grid        81 digits (uint8)
+    status      81 cell statuses (uint8)
+    scribbles   81 scribble masks (uint16)
+    givens      81 bit mask of the puzzle's given cells (11 bytes)
+    counts      digits entered (uint32) and hints used (uint16)
+    checksum    CRC32 of everything above (uint32)
+
+Autosaves are written atomically from a worker thread, so a save never stalls the GUI thread and a crash
+mid-write never leaves a truncated file behind.
+"""
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+from general.extras import write_atomic
+from . import sudoku_gameplay as sdk
+
+MAGIC = b'SDKG'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sBBxxI')
+COUNTS = struct.Struct('<IH')
+CHECKSUM = struct.Struct('<I')
+BOARD_SIZE = 81 + 81 + 81 * 2 + 11
+SAVE_SIZE = HEADER.size + BOARD_SIZE + COUNTS.size + CHECKSUM.size
+
+
+class SaveFormatError(Exception):
+    """Raised when save data is truncated, corrupted or of an unknown version."""
+
+
+def dump_game(system, elapsed, hints=0):
+    """Serialise a game.
+
+    Parameters
+    ----------
+    system: SudokuSystem
+        The game to save
+    elapsed: int
+        Elapsed time in tenths of a second
+    hints: int
+        Number of hints used
+
+    Returns
+    -------
+    bytes: The save data
+    """
+    givens = np.packbits(system.cell_status.reshape(81) == sdk.FIXED)
+    data = b''.join((HEADER.pack(MAGIC, FORMAT_VERSION, system.difficulty, elapsed),
+                     system.number_grid.tobytes(),
+                     system.cell_status.tobytes(),
+                     system.scribbles.astype('<u2').tobytes(),
+                     givens.tobytes(),
+                     COUNTS.pack(min(system.moves, 0xffffffff), min(hints, 0xffff))))
+    return data + CHECKSUM.pack(zlib.crc32(data))
+
+
+def load_game(system, data):
+    """Restore a game into system from save data. The conflicts are rebuilt in one vectorised pass.
+
+    Returns
+    -------
+    (int, int): Elapsed time in tenths of a second, and the number of hints used
+    """
+    if len(data) != SAVE_SIZE:
+        raise SaveFormatError('Save data has the wrong size')
+    body, (checksum,) = data[:-CHECKSUM.size], CHECKSUM.unpack(data[-CHECKSUM.size:])
+    if zlib.crc32(body) != checksum:
+        raise SaveFormatError('Save data is corrupted')
+    magic, version, difficulty, elapsed = HEADER.unpack_from(body)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise SaveFormatError('Not a save file of a known version')
+
+    offset = HEADER.size
+    grid = np.frombuffer(body, dtype=np.uint8, count=81, offset=offset)
+    status = np.frombuffer(body, dtype=np.uint8, count=81, offset=offset + 81)
+    scribbles = np.frombuffer(body, dtype='<u2', count=81, offset=offset + 162)
+    givens = np.unpackbits(np.frombuffer(body, dtype=np.uint8, count=11, offset=offset + 324))[:81].astype(bool)
+
+    system.clear_grid()
+    system.difficulty = difficulty
+    system.number_grid[:] = grid.reshape(9, 9)
+    system.scribbles[:] = scribbles.reshape(9, 9)
+    system.cell_status[:] = np.where(givens, sdk.FIXED, np.where(grid > 0, status, sdk.EMPTY)).reshape(9, 9)
+    system.givens = int(np.count_nonzero(givens))
+    system.moves, hints = COUNTS.unpack_from(body, offset + BOARD_SIZE)
+    # The solution is not saved, as solving the givens again takes a few milliseconds
+    system.find_solution()
+    system._rebuild_conflicts()
+    return elapsed, hints
+
+
+class AutoSaver:
+    """Writes save data on a background thread. Only the latest submitted data is kept, so a burst of moves
+    results in one write.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._pending = None
+        self._discard = False
+        self._writing = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='autosave', daemon=True)
+        self._thread.start()
+
+    def submit(self, data):
+        """Queue save data to be written"""
+        with self._condition:
+            self._pending = data
+            self._discard = False
+            self._condition.notify()
+
+    def discard(self):
+        """Remove the save file, e.g. once the game is finished"""
+        with self._condition:
+            self._pending = None
+            self._discard = True
+            self._condition.notify()
+
+    def flush(self):
+        """Block until everything queued has been written"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending is None and not self._discard and not self._writing)
+
+    def load(self, system):
+        """Restore the saved game into system.
+
+        Returns
+        -------
+        (int, int): Elapsed time in tenths of a second and the number of hints used, or None if there is no
+        usable save
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                return load_game(system, f.read())
+        except (OSError, SaveFormatError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print('Could not restore the saved game:', e)
+            return None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending is not None or self._discard)
+                data, discard = self._pending, self._discard
+                self._pending = None
+                self._discard = False
+                self._writing = True
+            try:
+                if discard:
+                    if os.path.exists(self.path):
+                        os.remove(self.path)
+                else:
+                    write_atomic(self.path, data)
+            except OSError as e:
+                print('Autosave failed:', e)
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
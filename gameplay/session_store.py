@@ -0,0 +1,208 @@
+"""
+Module that hosts many concurrent games in one process. Instead of one SudokuSystem per player, every game
+lives in a slot of shared preallocated NumPy blocks (struct of arrays), indexed through its session id.
+Creating and evicting a session is O(1), and checking which sessions are finished is one vectorised sweep.
+
+Moves follow the same rules as SudokuSystem: per-unit digit counters and per-cell conflict degrees are
+updated incrementally, visiting only the cells of the changed cell's units.
+"""
+import numpy as np
+
+from . import sudoku_gameplay as sdk
+from .sudoku_gameplay import EMPTY, VALID, INVALID, FIXED, CELL_UNITS, UNIT_CELLS
+
+DEFAULT_CAPACITY = 4096
+
+
+class SessionStoreFull(Exception):
+    """Raised when creating a session while every slot is taken."""
+
+
+class SessionStore:
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        """Preallocate the blocks for a number of sessions.
+
+        Parameters
+        ----------
+        capacity: int
+            The maximum number of sessions held at once
+        """
+        self.capacity = capacity
+        self.grid = np.zeros((capacity, 81), dtype=np.uint8)
+        self.status = np.zeros((capacity, 81), dtype=np.uint8)
+        self.scribbles = np.zeros((capacity, 81), dtype=np.uint16)
+        self.unit_counts = np.zeros((capacity, 27, 10), dtype=np.uint8)
+        self.conflicts = np.zeros((capacity, 81), dtype=np.uint8)
+        self.filled = np.zeros(capacity, dtype=np.int16)
+        self.conflicting = np.zeros(capacity, dtype=np.int16)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.session_ids = np.full(capacity, -1, dtype=np.int64)
+
+        self._slots = {}
+        self._free = list(range(capacity - 1, -1, -1))
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, session_id):
+        return session_id in self._slots
+
+    def create(self, puzzle):
+        """Start a session on a puzzle.
+
+        Parameters
+        ----------
+        puzzle: np.ndarray
+            The 9x9 (or flat 81) puzzle, 0 for empty cells
+
+        Returns
+        -------
+        int: The session id
+        """
+        if not self._free:
+            raise SessionStoreFull('All {} session slots are in use'.format(self.capacity))
+        slot = self._free.pop()
+        session_id = self._next_id
+        self._next_id += 1
+
+        values = np.asarray(puzzle, dtype=np.uint8).reshape(81)
+        self.grid[slot] = values
+        self.status[slot] = np.where(values > 0, FIXED, EMPTY)
+        self.scribbles[slot] = 0
+        self._rebuild(slot)
+        self.active[slot] = True
+        self.session_ids[slot] = session_id
+        self._slots[session_id] = slot
+        return session_id
+
+    def evict(self, session_id):
+        """End a session, freeing its slot"""
+        slot = self._slots.pop(session_id)
+        self.active[slot] = False
+        self.session_ids[slot] = -1
+        self._free.append(slot)
+
+    def slot_of(self, session_id):
+        return self._slots[session_id]
+
+    def get_grid(self, session_id):
+        """Get a 9x9 view of a session's number grid"""
+        return self.grid[self._slots[session_id]].reshape(9, 9)
+
+    def get_status(self, session_id):
+        """Get a 9x9 view of a session's cell statuses"""
+        return self.status[self._slots[session_id]].reshape(9, 9)
+
+    def is_finished(self, session_id):
+        slot = self._slots[session_id]
+        return self.filled.item(slot) == 81 and self.conflicting.item(slot) == 0
+
+    def finished_sessions(self):
+        """Sweep every session at once for completed boards.
+
+        Returns
+        -------
+        np.ndarray: The ids of the finished sessions
+        """
+        done = self.active & (self.filled == 81) & (self.conflicting == 0)
+        return self.session_ids[done]
+
+    def toggle_scribble(self, session_id, row, col, val):
+        """Toggle a scribbled digit, or clear the scribbles of the cell for 0"""
+        slot = self._slots[session_id]
+        if val:
+            self.scribbles[slot, row * 9 + col] ^= 1 << (int(val) - 1)
+        else:
+            self.scribbles[slot, row * 9 + col] = 0
+
+    def apply_move(self, session_id, row, col, val):
+        """Write a digit into a session's grid, 0 to erase it.
+
+        Returns
+        -------
+        bool: False if the cell is a given and the move was rejected, True otherwise
+        """
+        if not (0 <= row < 9 and 0 <= col < 9 and 0 <= val <= 9):
+            raise ValueError('Moves must have row and col within 0-8 and value within 0-9')
+        slot = self._slots[session_id]
+        i = row * 9 + col
+        grid = self.grid[slot]
+        if self.status[slot].item(i) == FIXED:
+            return False
+        prev_val = grid.item(i)
+        if prev_val == val:
+            return True
+
+        if prev_val:
+            self._remove_digit(slot, i, prev_val)
+            self.filled[slot] -= 1
+        grid[i] = val
+        if val:
+            self._place_digit(slot, i, val)
+            self.filled[slot] += 1
+        self._refresh_status(slot, i)
+        return True
+
+    def _place_digit(self, slot, i, digit):
+        grid = self.grid[slot]
+        counts = self.unit_counts[slot]
+        conflicts = self.conflicts[slot]
+        degree = 0
+        for u in CELL_UNITS[i]:
+            n = counts.item(u, digit)
+            if n:
+                degree += n
+                for j in UNIT_CELLS[u]:
+                    if j != i and grid.item(j) == digit:
+                        if not conflicts.item(j):
+                            self.conflicting[slot] += 1
+                        conflicts[j] += 1
+                        self._refresh_status(slot, j)
+            counts[u, digit] = n + 1
+        if degree:
+            self.conflicting[slot] += 1
+        conflicts[i] = degree
+
+    def _remove_digit(self, slot, i, digit):
+        grid = self.grid[slot]
+        counts = self.unit_counts[slot]
+        conflicts = self.conflicts[slot]
+        for u in CELL_UNITS[i]:
+            counts[u, digit] -= 1
+            if counts.item(u, digit):
+                for j in UNIT_CELLS[u]:
+                    if j != i and grid.item(j) == digit:
+                        conflicts[j] -= 1
+                        if not conflicts.item(j):
+                            self.conflicting[slot] -= 1
+                        self._refresh_status(slot, j)
+        if conflicts.item(i):
+            self.conflicting[slot] -= 1
+        conflicts[i] = 0
+
+    def _refresh_status(self, slot, i):
+        status = self.status[slot]
+        if status.item(i) == FIXED:
+            return
+        if not self.grid.item(slot, i):
+            status[i] = EMPTY
+        else:
+            status[i] = INVALID if self.conflicts.item(slot, i) else VALID
+
+    def _rebuild(self, slots):
+        """Recompute the counters, conflicts and statuses of one or more slots in one vectorised pass"""
+        values = self.grid[slots].astype(np.intp)
+        unit_counts = sdk.count_unit_digits(values)
+        conflicts = sdk.count_conflicts(values, unit_counts)
+        self.unit_counts[slots] = unit_counts
+        self.conflicts[slots] = conflicts
+        self.filled[slots] = np.count_nonzero(values, axis=-1)
+        self.conflicting[slots] = np.count_nonzero(conflicts, axis=-1)
+
+        status = self.status[slots]
+        editable = status != FIXED
+        status[editable] = np.where(values[editable] == 0, EMPTY,
+                                    np.where(conflicts[editable] > 0, INVALID, VALID))
+        self.status[slots] = status
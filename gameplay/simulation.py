@@ -0,0 +1,190 @@
+"""
+Headless driver that plays scripted or random moves against SudokuSystem, without Qt, to measure the
+throughput of the gameplay paths. It reports moves per second, the cost of each path per call, and an
+allocation profile.
+
+Run from the repository root:
+    python -m gameplay.simulation --moves 100000
+    python -m gameplay.simulation --script moves.txt
+
+A script has one move per line as row,col,value for a digit (0 to erase), or row,col,value,s for a scribble
+(value 0 to clear the scribbles). Lines starting with # are ignored.
+"""
+import argparse
+import contextlib
+import io
+import random
+import time
+import tracemalloc
+from functools import wraps
+
+import numpy as np
+
+from . import sudoku_gameplay as sdk
+
+MEASURED_PATHS = ('replace_cell_number', 'invalid_cell_check', 'toggle_scribble', 'completion_check')
+
+
+def load_board(difficulty, test_board=False):
+    """Create a SudokuSystem with a fresh puzzle, keeping the generator quiet"""
+    system = sdk.SudokuSystem()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if test_board:
+            system.generate_test_board(difficulty)
+        else:
+            system.generate_random_board(difficulty)
+    return system
+
+
+def random_moves(system, n_moves, scribble_ratio=0.3, rng=None):
+    """Generate random moves on the editable cells of a board.
+
+    Returns
+    -------
+    list: (row, col, value, is_scribble) tuples
+    """
+    rng = rng or random.Random()
+    editable = [(int(r), int(c)) for r, c in zip(*np.nonzero(system.cell_status != sdk.FIXED))]
+    moves = []
+    for _ in range(n_moves):
+        row, col = rng.choice(editable)
+        if rng.random() < scribble_ratio:
+            moves.append((row, col, rng.randint(1, 9), True))
+        else:
+            moves.append((row, col, rng.randint(0, 9), False))
+    return moves
+
+
+def read_script(path):
+    """Read moves from a script file.
+
+    Returns
+    -------
+    list: (row, col, value, is_scribble) tuples
+    """
+    moves = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = line.split(',')
+            moves.append((int(fields[0]), int(fields[1]), int(fields[2]),
+                          len(fields) > 3 and fields[3].strip() == 's'))
+    return moves
+
+
+def play(system, moves):
+    """Apply moves the way the GUI does, checking for completion after every digit"""
+    for row, col, val, is_scribble in moves:
+        if is_scribble:
+            if val:
+                system.toggle_scribble(row, col, val)
+            else:
+                system.clear_scribble(row, col)
+        else:
+            system.replace_cell_number(row, col, val)
+            system.completion_check()
+
+
+class PathTimer:
+    """Wraps methods of one SudokuSystem to accumulate their call counts and inclusive times"""
+
+    def __init__(self, system, names=MEASURED_PATHS):
+        self.calls = dict.fromkeys(names, 0)
+        self.seconds = dict.fromkeys(names, 0.0)
+        for name in names:
+            setattr(system, name, self._wrap(name, getattr(system, name)))
+
+    def _wrap(self, name, method):
+        clock = time.perf_counter
+
+        @wraps(method)
+        def timed(*args):
+            start = clock()
+            result = method(*args)
+            self.seconds[name] += clock() - start
+            self.calls[name] += 1
+            return result
+        return timed
+
+
+def run_benchmark(difficulty=2, n_moves=20000, script=None, scribble_ratio=0.3, seed=None, test_board=False,
+                  top=10):
+    """Play the same moves three times on fresh copies of one board: bare for throughput, with per-path
+    timers, and under tracemalloc for allocations.
+
+    Returns
+    -------
+    dict: The measurements
+    """
+    rng = random.Random(seed)
+    random.seed(seed)
+    board = load_board(difficulty, test_board)
+    moves = read_script(script) if script else random_moves(board, n_moves, scribble_ratio, rng)
+
+    def fresh_copy():
+        system = sdk.SudokuSystem()
+        system.difficulty = board.difficulty
+        system.number_grid[:] = board.number_grid
+        system.cell_status[:] = board.cell_status
+        system._rebuild_conflicts()
+        return system
+
+    system = fresh_copy()
+    start = time.perf_counter()
+    play(system, moves)
+    elapsed = time.perf_counter() - start
+
+    system = fresh_copy()
+    timer = PathTimer(system)
+    play(system, moves)
+
+    system = fresh_copy()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    play(system, moves)
+    after = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    allocations = after.compare_to(before, 'lineno')[:top]
+
+    return {'moves': len(moves),
+            'seconds': elapsed,
+            'moves_per_second': len(moves) / elapsed if elapsed else float('inf'),
+            'paths': {name: (timer.calls[name], timer.seconds[name]) for name in timer.calls},
+            'retained_bytes': current,
+            'peak_bytes': peak,
+            'allocations': allocations}
+
+
+def print_report(result):
+    print('Moves played:      {}'.format(result['moves']))
+    print('Moves per second:  {:,.0f} ({:.3f} s)'.format(result['moves_per_second'], result['seconds']))
+    print()
+    print('{:<22}{:>10}{:>14}{:>16}'.format('Path', 'Calls', 'Mean (us)', 'Calls per sec'))
+    for name, (calls, seconds) in result['paths'].items():
+        mean = seconds / calls * 1e6 if calls else 0.0
+        rate = calls / seconds if seconds else 0.0
+        print('{:<22}{:>10}{:>14.2f}{:>16,.0f}'.format(name, calls, mean, rate))
+    print('(Path times are inclusive: replace_cell_number contains invalid_cell_check)')
+    print()
+    print('Allocations: {:,} bytes retained, {:,} bytes peak'.format(result['retained_bytes'],
+                                                                      result['peak_bytes']))
+    for stat in result['allocations']:
+        print('  ', stat)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the gameplay core without the GUI.')
+    parser.add_argument('--moves', type=int, default=20000, help='Number of random moves')
+    parser.add_argument('--script', help='File of scripted moves, instead of random ones')
+    parser.add_argument('--difficulty', type=int, default=2)
+    parser.add_argument('--scribble-ratio', type=float, default=0.3, help='Share of random moves that scribble')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--test-board', action='store_true', help='Use gameplay/test_board.txt')
+    parser.add_argument('--top', type=int, default=10, help='Number of allocation sites to list')
+    args = parser.parse_args()
+
+    print_report(run_benchmark(args.difficulty, args.moves, args.script, args.scribble_ratio, args.seed,
+                               args.test_board, args.top))
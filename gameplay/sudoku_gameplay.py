@@ -1,5 +1,7 @@
 import numpy as np
 from . import Sudoku_Generator as SdkGen
+from . import Sudoku_Solver as solver
+from .journal import MoveJournal
 
 EMPTY = 0
 VALID = 1
@@ -13,29 +15,155 @@ else:
     test_dir = './gameplay/test_board.txt'
 
 
+# Flat cell indices (row * 9 + col) grouped into the 27 units: 9 rows, then 9 columns, then 9 boxes
+UNIT_CELLS = tuple(tuple(r * 9 + c for c in range(9)) for r in range(9)) + \
+             tuple(tuple(r * 9 + c for r in range(9)) for c in range(9)) + \
+             tuple(tuple((br + r) * 9 + bc + c for r in range(3) for c in range(3))
+                   for br in range(0, 9, 3) for bc in range(0, 9, 3))
+# The row, column and box unit of each cell
+CELL_UNITS = tuple((i // 9, 9 + i % 9, 18 + (i // 27) * 3 + (i % 9) // 3) for i in range(81))
+# Every cell sharing a unit with each cell, including itself
+CELL_NEIGHBOURS = tuple(tuple(sorted(set(j for u in CELL_UNITS[i] for j in UNIT_CELLS[u]))) for i in range(81))
+UNIT_CELLS_ARRAY = np.array(UNIT_CELLS)
+CELL_UNITS_ARRAY = np.array(CELL_UNITS)
+
+# Scribbles and candidates are stored as a bitmask per cell, digit d being bit d-1.
+# This maps each mask to its digits.
+SCRIBBLE_DIGITS = tuple(tuple(d for d in range(1, 10) if mask & (1 << (d - 1))) for mask in range(1 << 9))
+ALL_DIGITS = (1 << 9) - 1
+DIGIT_BITS = 1 << np.arange(9, dtype=np.uint16)
+
+# A move for SudokuSystem.apply_moves. A scribble move toggles the digit, or clears the scribbles for 0.
+MOVE_DTYPE = np.dtype([('row', np.uint8), ('col', np.uint8), ('value', np.uint8), ('is_scribble', np.bool_)])
+# Batches smaller than this are applied move by move, as a full rebuild would cost more
+BATCH_REBUILD_THRESHOLD = 16
+
+
+def count_unit_digits(values):
+    """Count how many times each digit appears in each unit, in one vectorised pass.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        Cell values of shape (..., 81), 0 being empty
+
+    Returns
+    -------
+    np.ndarray: Counts of shape (..., 27, 10), indexed by unit then digit. Empty cells are not counted.
+    """
+    one_hot = values[..., None] == np.arange(10)
+    one_hot[..., 0] = False
+    return one_hot[..., UNIT_CELLS_ARRAY, :].sum(axis=-2)
+
+
+def count_conflicts(values, unit_counts):
+    """Get the conflict degree of every cell: the number of other cells sharing its digit in each of its units,
+    summed over its row, column and box. Empty cells have no conflicts.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        Cell values of shape (..., 81)
+    unit_counts: np.ndarray
+        Output of count_unit_digits for values
+
+    Returns
+    -------
+    np.ndarray: Conflict degrees of shape (..., 81)
+    """
+    cell_counts = unit_counts[..., CELL_UNITS_ARRAY, :]
+    same_digit = np.take_along_axis(cell_counts, values[..., None, None].astype(np.intp), axis=-1)[..., 0]
+    return np.where(values > 0, same_digit.sum(axis=-1) - 3, 0)
+
+
+def compute_candidates(grid):
+    """Get the legal digits of every empty cell in one vectorised pass, by combining the digits present
+    in each row, column and box.
+
+    Parameters
+    ----------
+    grid: np.ndarray
+        The 9x9 number grid
+
+    Returns
+    -------
+    np.ndarray: 9x9 candidate bitmasks, 0 for filled cells
+    """
+    present = grid[..., None] == np.arange(1, 10)
+    in_row = present.any(axis=1)[:, None, :]
+    in_col = present.any(axis=0)[None, :, :]
+    in_box = present.reshape(3, 3, 3, 3, 9).any(axis=(1, 3)).repeat(3, axis=0).repeat(3, axis=1)
+    legal = ~(in_row | in_col | in_box) & (grid == 0)[..., None]
+    return (legal * DIGIT_BITS).sum(axis=-1).astype(np.uint16)
+
+
 class SudokuSystem:
 
     def __init__(self):
         self.number_grid = np.zeros((9, 9), dtype=np.uint8)
         self.cell_status = np.zeros((9, 9), dtype=np.uint8)
-        self.scribbles = np.zeros((9, 9), dtype='<U9')
-        self.offending_cells = []
-        for i in range(9):
-            row = []
-            for j in range(9):
-                row.append([])
-            self.offending_cells.append(row)
+        self.scribbles = np.zeros((9, 9), dtype=np.uint16)
+
+        # Flat views sharing memory with the grids, for indexing cells by a single number
+        self._grid_flat = self.number_grid.reshape(81)
+        self._status_flat = self.cell_status.reshape(81)
+
+        # The number of times each digit appears in each unit, and the conflict degree of each cell
+        self.unit_counts = [[0] * 10 for _ in range(27)]
+        self.conflicts = [0] * 81
+        # Bitmask of the digits present in each unit
+        self.unit_masks = [0] * 27
+        # Running totals of filled cells and of cells in conflict, for constant time completion checks
+        self.filled_cells = 0
+        self.conflicting_cells = 0
+
+        self.journal = MoveJournal()
+        self.difficulty = 0
+        # Number of given cells in the puzzle, and of digits the player entered. Erasing a digit is not a move
+        self.givens = 0
+        self.moves = 0
+
+        # Flat indices of the cells whose digit, status or scribbles changed since the display last took them
+        self.dirty_cells = set(range(81))
+
+        # When on, the legal digits of every empty cell are kept up to date and shown in place of scribbles
+        self.auto_candidates = False
+        self.candidates = np.zeros((9, 9), dtype=np.uint16)
+        self._candidates_flat = self.candidates.reshape(81)
+
+        # The solved grid of the puzzle, all 0 if unknown. In strict mode, digits that differ from it are
+        # marked invalid straight away, even without a visible conflict
+        self.solution = np.zeros((9, 9), dtype=np.uint8)
+        self._solution_flat = self.solution.reshape(81)
+        self.strict = False
 
     def clear_grid(self):
         self.number_grid[:] = 0
         self.cell_status[:] = FIXED
-        self.scribbles[:] = ''
-        for i in range(9):
-            for j in range(9):
-                while self.offending_cells[i][j]:
-                    self.offending_cells[i][j].pop()
+        self.scribbles[:] = 0
+        for counts in self.unit_counts:
+            counts[:] = [0] * 10
+        self.conflicts[:] = [0] * 81
+        self.unit_masks[:] = [0] * 27
+        self.candidates[:] = 0
+        self.solution[:] = 0
+        self.filled_cells = 0
+        self.conflicting_cells = 0
+        self.givens = 0
+        self.moves = 0
+        self.dirty_cells.update(range(81))
+        self.journal.clear()
 
     def replace_cell_number(self, row, col, val):
+        prev_val = self.number_grid.item(row, col)
+        if prev_val != val:
+            self.journal.record(row * 9 + col, prev_val, val, self.scribbles.item(row, col))
+            if val:
+                self.moves += 1
+        self._write_number(row, col, val)
+
+    def _write_number(self, row, col, val):
+        self.dirty_cells.add(row * 9 + col)
         prev_val = self.number_grid[row, col]
         self.number_grid[row, col] = int(val)
         self.invalid_cell_check(row, col, prev_val)
@@ -43,13 +171,135 @@ class SudokuSystem:
             self.change_cell_status(row, col, EMPTY)
 
     def clear_scribble(self, row, col):
-        self.scribbles[row, col] = ''
+        self._record_scribble(row, col)
+        self.scribbles[row, col] = 0
 
     def toggle_scribble(self, row, col, val):
-        if val in self.scribbles[row, col]:
-            self.scribbles[row, col] = self.scribbles[row, col].replace(val, '')
+        self._record_scribble(row, col)
+        self.scribbles[row, col] ^= 1 << (int(val) - 1)
+
+    def _record_scribble(self, row, col):
+        self.dirty_cells.add(row * 9 + col)
+        val = self.number_grid.item(row, col)
+        self.journal.record(row * 9 + col, val, val, self.scribbles.item(row, col))
+
+    def undo(self):
+        """Revert the last edit, number or scribble.
+
+        Returns
+        -------
+        (int, int): The row and column of the reverted cell, or None if there is nothing to undo
+        """
+        pos = self.journal.undo()
+        if pos < 0:
+            return None
+        cell, old, new, mask = self.journal.get(pos)
+        return self._restore_cell(pos, cell, old)
+
+    def redo(self):
+        """Reapply the last undone edit.
+
+        Returns
+        -------
+        (int, int): The row and column of the changed cell, or None if there is nothing to redo
+        """
+        pos = self.journal.redo()
+        if pos < 0:
+            return None
+        cell, old, new, mask = self.journal.get(pos)
+        return self._restore_cell(pos, cell, new)
+
+    def _restore_cell(self, pos, cell, val):
+        row, col = divmod(cell, 9)
+        self._write_number(row, col, val)
+        self.scribbles[row, col] = self.journal.swap_mask(pos, self.scribbles.item(row, col))
+        return row, col
+
+    def get_cell_scribbles(self, row, col):
+        if self.auto_candidates:
+            return SCRIBBLE_DIGITS[self.candidates.item(row, col)]
+        return SCRIBBLE_DIGITS[self.scribbles.item(row, col)]
+
+    def set_auto_candidates(self, state):
+        """Turn the automatic candidates on or off. Turning them on computes them for the whole board.
+        """
+        self.auto_candidates = state
+        if state:
+            self.candidates[:] = compute_candidates(self.number_grid)
+        self.dirty_cells.update(range(81))
+
+    def take_dirty_cells(self):
+        """Get the cells changed since the last call, for repainting only those.
+
+        Returns
+        -------
+        set: Flat indices of the changed cells
+        """
+        cells = self.dirty_cells
+        self.dirty_cells = set()
+        return cells
+
+    def _update_candidates(self, i):
+        """Recompute the candidates of the cells sharing a unit with cell i"""
+        grid = self._grid_flat
+        masks = self.unit_masks
+        for j in CELL_NEIGHBOURS[i]:
+            if grid.item(j):
+                mask = 0
+            else:
+                r, c, b = CELL_UNITS[j]
+                mask = ALL_DIGITS & ~(masks[r] | masks[c] | masks[b])
+            if self._candidates_flat.item(j) != mask:
+                self._candidates_flat[j] = mask
+                self.dirty_cells.add(j)
+
+    def set_strict(self, state):
+        """Turn the strict mode on or off, updating the status of every filled cell
+        """
+        self.strict = state
+        self._refresh_all_statuses(self._grid_flat.astype(np.intp), np.array(self.conflicts))
+        self.dirty_cells.update(range(81))
+
+    def get_cell_solution(self, row, col):
+        """Get the digit of a cell in the solution, or 0 if the solution is unknown"""
+        return self.solution.item(row, col)
+
+    def find_solution(self):
+        """Solve the givens to fill in the solution, for boards loaded without one
+        """
+        givens = np.where(self.cell_status == FIXED, self.number_grid, 0)
+        values = solver.solve_grid(SdkGen.array_to_grid(givens))
+        if values:
+            self._solution_flat[:] = [int(values[s]) for s in solver.squares]
         else:
-            self.scribbles[row, col] += val
+            self.solution[:] = 0
+
+    def reveal_cell(self, row, col):
+        """Fill a cell with its digit from the solution, as an undoable move.
+
+        Returns
+        -------
+        int: The digit revealed, or 0 if the cell is fixed or the solution is unknown
+        """
+        val = self.solution.item(row, col)
+        if not val or self.cell_status.item(row, col) == FIXED:
+            return 0
+        self.replace_cell_number(row, col, val)
+        return val
+
+    def auto_solve(self):
+        """Fill every cell that is empty or wrong with its digit from the solution, in one batch.
+
+        Returns
+        -------
+        (np.ndarray, bool): As apply_moves
+        """
+        cells = np.flatnonzero((self._solution_flat > 0) & (self._status_flat != FIXED)
+                               & (self._grid_flat != self._solution_flat))
+        moves = np.zeros(len(cells), dtype=MOVE_DTYPE)
+        moves['row'], moves['col'] = np.divmod(cells, 9)
+        moves['value'] = self._solution_flat[cells]
+        return self.apply_moves(moves)
 
     def get_cell_number(self, row, col):
         return self.number_grid[row, col]
@@ -61,63 +311,190 @@ class SudokuSystem:
     def get_cell_status(self, row, col):
         return self.cell_status[row, col]
 
+    def is_solved(self):
+        """Check whether every cell is filled without conflicts, without changing any status"""
+        return self.filled_cells == 81 and self.conflicting_cells == 0
+
     def completion_check(self):
-        if np.all(np.logical_or(self.cell_status == VALID, self.cell_status == FIXED)):
+        if self.is_solved():
             self.cell_status[:] = FIXED
+            self.dirty_cells.update(range(81))
+            self.journal.clear()
             return True
         else:
             return False
 
     def invalid_cell_check(self, row, col, prev_num):
-        val_check = self.number_grid[row, col]
-
-        if not prev_num == val_check or val_check == 0:
-            while self.offending_cells[row][col]:
-                r, c = self.offending_cells[row][col].pop()
-                try:
-                    self.offending_cells[r][c].remove((row, col))
-                except ValueError:
-                    print('No such cell found')
-                if not self.offending_cells[r][c]:
-                    self.change_cell_status(r, c, VALID)
-
-        if not val_check == 0:
-
-            row_check = np.where(self.number_grid[row, :] == val_check)[0]
-            col_check = np.where(self.number_grid[:, col] == val_check)[0]
-            local_grid_row = int(row / 3) * 3
-            local_grid_col = int(col / 3) * 3
-            local_grid_check_row, local_grid_check_col = np.where(
-                self.number_grid[local_grid_row:local_grid_row + 3, local_grid_col:local_grid_col + 3] == val_check)
-
-            if len(row_check) == 1 and len(col_check) == 1 and len(local_grid_check_row) == 1:
-                self.cell_status[row, col] = VALID
+        """Update the conflicts after a cell changed from prev_num to its current number. Only the cells sharing
+        a unit with the changed cell and holding either number are visited.
+        """
+        i = row * 9 + col
+        prev_num = int(prev_num)
+        val = self._grid_flat.item(i)
+        if prev_num == val:
+            return
+
+        if prev_num:
+            self._remove_digit(i, prev_num)
+            self.filled_cells -= 1
+        if val:
+            self._place_digit(i, val)
+            self.filled_cells += 1
+        self._refresh_status(i)
+        if self.auto_candidates:
+            self._update_candidates(i)
+
+    def _place_digit(self, i, digit):
+        grid = self._grid_flat
+        degree = 0
+        for u in CELL_UNITS[i]:
+            counts = self.unit_counts[u]
+            n = counts[digit]
+            if n:
+                degree += n
+                for j in UNIT_CELLS[u]:
+                    if j != i and grid.item(j) == digit:
+                        if not self.conflicts[j]:
+                            self.conflicting_cells += 1
+                        self.conflicts[j] += 1
+                        self._refresh_status(j)
+            else:
+                self.unit_masks[u] |= 1 << (digit - 1)
+            counts[digit] = n + 1
+        if degree:
+            self.conflicting_cells += 1
+        self.conflicts[i] = degree
+
+    def _remove_digit(self, i, digit):
+        grid = self._grid_flat
+        for u in CELL_UNITS[i]:
+            counts = self.unit_counts[u]
+            counts[digit] -= 1
+            if not counts[digit]:
+                self.unit_masks[u] &= ~(1 << (digit - 1))
             else:
-                self.cell_status[row, col] = INVALID
-                bad_cells = []
-                if not len(row_check) == 1:
-                    for c in row_check:
-                        if not c == col:
-                            bad_cells.append((row, c))
-                            self.offending_cells[row][c].append((row, col))
-                            self.change_cell_status(row, c, INVALID)
-                if not len(col_check) == 1:
-                    for r in col_check:
-                        if not r == row:
-                            bad_cells.append((r, col))
-                            self.offending_cells[r][col].append((row, col))
-                            self.change_cell_status(r, col, INVALID)
-                if not len(local_grid_check_row) == 1:
-                    for r, c in zip(local_grid_check_row + local_grid_row, local_grid_check_col + local_grid_col):
-                        if not (c == col or r == row):
-                            bad_cells.append((r, c))
-                            self.offending_cells[r][c].append((row, col))
-                            self.change_cell_status(r, c, INVALID)
-
-                self.offending_cells[row][col] = bad_cells
+                for j in UNIT_CELLS[u]:
+                    if j != i and grid.item(j) == digit:
+                        self.conflicts[j] -= 1
+                        if not self.conflicts[j]:
+                            self.conflicting_cells -= 1
+                        self._refresh_status(j)
+        if self.conflicts[i]:
+            self.conflicting_cells -= 1
+        self.conflicts[i] = 0
+
+    def _refresh_status(self, i):
+        """Set the status of a filled, non-fixed cell from its conflict degree"""
+        status = self._status_flat.item(i)
+        val = self._grid_flat.item(i)
+        if status == FIXED or not val:
+            return
+        if self.conflicts[i] or (self.strict and self._solution_flat.item(i) not in (0, val)):
+            new_status = INVALID
+        else:
+            new_status = VALID
+        if new_status != status:
+            self._status_flat[i] = new_status
+            self.dirty_cells.add(i)
+
+    def apply_moves(self, moves):
+        """Apply a batch of moves in one call. Moves on fixed cells are ignored. Large batches are reduced to
+        their net effect per cell and the conflicts are rebuilt in one vectorised pass.
+
+        Parameters
+        ----------
+        moves: np.ndarray or sequence
+            Records of (row, col, value, is_scribble), in the order they were played. See MOVE_DTYPE
+
+        Returns
+        -------
+        (np.ndarray, bool): A copy of the cell statuses, and whether the puzzle is complete
+        """
+        moves = np.asarray(moves, dtype=MOVE_DTYPE) if len(moves) else np.zeros(0, dtype=MOVE_DTYPE)
+        if np.any(moves['row'] > 8) or np.any(moves['col'] > 8) or np.any(moves['value'] > 9):
+            raise ValueError('Moves must have row and col within 0-8 and value within 0-9')
+
+        cells = moves['row'].astype(np.intp) * 9 + moves['col']
+        playable = self._status_flat[cells] != FIXED
+        moves, cells = moves[playable], cells[playable]
+
+        if len(moves) < BATCH_REBUILD_THRESHOLD:
+            for (row, col, val, is_scribble) in moves.tolist():
+                if not is_scribble:
+                    self.replace_cell_number(row, col, val)
+                elif val:
+                    self.toggle_scribble(row, col, val)
+                else:
+                    self.clear_scribble(row, col)
+        else:
+            self._apply_net_moves(moves, cells)
+
+        # Completion marks every cell FIXED, so it runs before the statuses are copied
+        done = self.completion_check()
+        return self.cell_status.copy(), done
+
+    def _apply_net_moves(self, moves, cells):
+        order = np.arange(len(moves))
+        is_scribble = moves['is_scribble']
+
+        # The last digit written to each cell wins
+        number_values = np.full(81, -1, dtype=np.intp)
+        number_order = order[~is_scribble]
+        number_values[cells[number_order]] = moves['value'][number_order]
+
+        # Scribble toggles commute, so only the ones after the last clear of each cell matter
+        scribble_order = order[is_scribble]
+        scribble_cells = cells[scribble_order]
+        scribble_values = moves['value'][scribble_order]
+        last_clear = np.full(81, -1, dtype=np.intp)
+        clearing = scribble_values == 0
+        np.maximum.at(last_clear, scribble_cells[clearing], scribble_order[clearing])
+        toggling = ~clearing & (scribble_order > last_clear[scribble_cells])
+        toggles = np.zeros(81, dtype=np.uint16)
+        np.bitwise_xor.at(toggles, scribble_cells[toggling],
+                          DIGIT_BITS[scribble_values[toggling].astype(np.intp) - 1])
+
+        old_values = self._grid_flat.copy()
+        old_masks = self.scribbles.reshape(81).copy()
+        new_values = np.where(number_values >= 0, number_values, old_values)
+        new_masks = np.where(last_clear >= 0, toggles, old_masks ^ toggles)
+
+        self.moves += int(np.count_nonzero((new_values != old_values) & (new_values != 0)))
+        changed = np.flatnonzero((new_values != old_values) | (new_masks != old_masks))
+        for i, old, new, mask in zip(changed.tolist(), old_values[changed].tolist(),
+                                     new_values[changed].tolist(), old_masks[changed].tolist()):
+            self.journal.record(i, old, new, mask)
+
+        self._grid_flat[:] = new_values
+        self.scribbles.reshape(81)[:] = new_masks
+        self._status_flat[(self._status_flat != FIXED) & (new_values == 0)] = EMPTY
+        self._rebuild_conflicts()
+
+    def _rebuild_conflicts(self):
+        """Recompute the unit counts and conflicts of the whole board, e.g. after loading a new board"""
+        values = self._grid_flat.astype(np.intp)
+        unit_counts = count_unit_digits(values)
+        conflicts = count_conflicts(values, unit_counts)
+        self.unit_counts = unit_counts.tolist()
+        self.conflicts = conflicts.tolist()
+        self.unit_masks = (unit_counts[:, 1:] > 0).dot(DIGIT_BITS.astype(np.intp)).tolist()
+        if self.auto_candidates:
+            self.candidates[:] = compute_candidates(self.number_grid)
+        self.filled_cells = int(np.count_nonzero(values))
+        self.conflicting_cells = int(np.count_nonzero(conflicts))
+        self._refresh_all_statuses(values, conflicts)
+        self.dirty_cells.update(range(81))
+
+    def _refresh_all_statuses(self, values, conflicts):
+        invalid = conflicts > 0
+        if self.strict:
+            invalid |= (self._solution_flat > 0) & (self._solution_flat != values)
+        editable = (self._status_flat != FIXED) & (values > 0)
+        self._status_flat[editable] = np.where(invalid[editable], INVALID, VALID)
 
     def generate_test_board(self, difficulty):
         self.clear_grid()
+        self.difficulty = difficulty
         try:
             with open(test_dir, 'r') as f:
                 lines = f.readlines()
@@ -132,6 +509,9 @@ class SudokuSystem:
 
             for r, c in zip(row, col):
                 self.cell_status[r, c] = EMPTY
+            self.givens = 81 - len(row)
+            self.find_solution()
+            self._rebuild_conflicts()
         except Exception as e:
             print(e)
             print('Something went wrong loading the test file. Generating a random board instead')
@@ -139,8 +519,11 @@ class SudokuSystem:
 
     def generate_random_board(self, difficulty):
         self.clear_grid()
-        self.number_grid[:] = SdkGen.generate_sudoku_puzzle(difficulty)
+        self.difficulty = difficulty
+        self.number_grid[:], self.solution[:] = SdkGen.generate_sudoku_puzzle_with_solution(difficulty)
         row, col = np.where(self.number_grid == 0)
 
         for r, c in zip(row, col):
             self.cell_status[r, c] = EMPTY
+        self.givens = 81 - len(row)
+        self._rebuild_conflicts()
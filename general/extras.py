@@ -1,6 +1,26 @@
+import os
+import tempfile
+
+
 def bound_value(lower, val, higher):
     return min(max(val, lower), higher)
 
 
 def print_rect_info(rect):
     print(rect.x(), rect.y(), rect.width(), rect.height())
+
+
+def write_atomic(path, data):
+    """Write data, either str or bytes, to a temporary file next to path, then move it into place"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(data, bytes) else 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -1,62 +1,290 @@
+"""Reading and writing of the high score file. Each difficulty has its placings as 'name,time' lines, separated by
+'---' lines. Times are integer tenths of a second; files from older versions, with times as 'MM:SS:T' strings, are
+still read.
+
+In memory, each difficulty is a Leaderboard holding its times in a sorted list, so a time is ranked and inserted
+with a binary search, and boards can hold thousands of placings.
+
+The file is replaced atomically, so a crash mid-write leaves the previous scores in place. HighScoreStore does the
+writing on a worker thread, and can be shared by several running instances of the game: each write takes a lock
+on the file and merges the new placings into the scores currently on disk, and other instances notice the change
+from the file's modification time and size.
+"""
+import bisect
+import contextlib
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+from .extras import write_atomic
+
 DIFFICULTIES = ['Very Easy', 'Easy', 'Normal', 'Hard', 'Insane']
+# Number of placings in a new high score file
+PLACINGS = 5
+# Number of placings kept per difficulty
+DEPTH = 1000
+# Seconds to wait before retrying a failed write
+RETRY_DELAY = 1.0
 
 
-def generate_highscore_file(file):
-    with open(file, 'w') as f:
-        for i in range(5):
-            names = []
-            times = []
-            for j, name in enumerate('ABCDE'):
-                names.append(name*(i+1))
-                times.append('{:02d}:00:0'.format((j+1)*(i+1)))
-            info = [','.join([name, time]) for name, time in zip(names, times)]
-            f.write('\n'.join(info))
-            if not i == 4:
-                f.write('\n---\n')
-
-
-def read_highscore_file(file):
-    with open(file, 'r') as f:
-        file_data = f.read()
+def parse_time(text):
+    """Get a time in tenths of a second from either an integer string or a 'MM:SS:T' string"""
+    text = text.strip()
+    if ':' in text:
+        minutes, seconds, tenths = text.split(':')
+        return (int(minutes) * 60 + int(seconds)) * 10 + int(tenths)
+    return int(text)
+
+
+def format_time(tenths):
+    """Format a time in tenths of a second as such: (minutes):(seconds):(A tenth of a second)"""
+    return "{:02d}:{:02d}:{:1d}".format(tenths // 600, tenths // 10 % 60, tenths % 10)
+
+
+class Leaderboard:
+    """The placings of one difficulty, fastest first, as parallel lists of times and names"""
+
+    def __init__(self, depth=DEPTH):
+        self.depth = depth
+        self.times = []
+        self.names = []
+
+    def __len__(self):
+        return len(self.times)
+
+    def rank(self, time):
+        """Get the 0-based rank a time would take, after any equal times, or -1 if it would not be kept"""
+        rank = bisect.bisect_right(self.times, time)
+        return rank if rank < self.depth else -1
+
+    def insert(self, name, time):
+        """Insert a placing, dropping the slowest one if the board is full.
+
+        Returns
+        -------
+        int: The 0-based rank taken, or -1 if the time was not kept
+        """
+        rank = self.rank(time)
+        if rank >= 0:
+            self.times.insert(rank, time)
+            self.names.insert(rank, name)
+            if len(self.times) > self.depth:
+                self.times.pop()
+                self.names.pop()
+        return rank
+
+    def page(self, start, count):
+        """Get count placings from the 0-based rank start on, as a list of {'name', 'time'} dicts"""
+        return [{'name': name, 'time': time}
+                for name, time in zip(self.names[start:start + count], self.times[start:start + count])]
+
+    def lines(self):
+        return ['{},{:d}'.format(name, time) for name, time in zip(self.names, self.times)]
+
+
+def default_placings(i, depth=DEPTH):
+    board = Leaderboard(depth)
+    for j, name in enumerate('ABCDE'):
+        board.insert(name * (i + 1), (j + 1) * (i + 1) * 600)
+    return board
+
+
+def default_highscores(depth=DEPTH):
+    return {diff: default_placings(i, depth) for i, diff in enumerate(DIFFICULTIES)}
+
+
+def serialise_highscores(data):
+    return '\n---\n'.join('\n'.join(data[diff].lines()) for diff in DIFFICULTIES)
+
 
-    highscore_list = {}
+def parse_highscores(file_data, depth=DEPTH):
+    """Parse the contents of a high score file. A difficulty with no readable placing gets the default ones,
+    so a damaged file never stops the game from starting.
+    """
+    highscore_list = default_highscores(depth)
     for diff, data in zip(DIFFICULTIES, file_data.split('\n---\n')):
-        diff_list = []
+        board = Leaderboard(depth)
         for line in data.split('\n'):
-            info = {}
-            placing_info = line.split(',')
-            info['name'] = placing_info[0]
-            info['time'] = placing_info[1]
-            diff_list.append(info)
-        highscore_list[diff] = diff_list
-
+            name, _, time = line.rpartition(',')
+            try:
+                board.insert(name, parse_time(time))
+            except ValueError:
+                continue
+        if len(board):
+            highscore_list[diff] = board
     return highscore_list
 
 
+def generate_highscore_file(file):
+    write_highscore_file(file, default_highscores())
+
+
+def read_highscore_file(file, depth=DEPTH):
+    with open(file, 'r') as f:
+        return parse_highscores(f.read(), depth)
+
+
 def write_highscore_file(file, data):
-    with open(file, 'w') as f:
-        for diff in DIFFICULTIES:
-            info = [','.join([placing_info['name'], placing_info['time']]) for placing_info in data[diff]]
-            f.write('\n'.join(info))
-            if not diff == DIFFICULTIES[-1]:
-                f.write('\n---\n')
+    write_atomic(file, serialise_highscores(data))
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Hold an exclusive lock shared by every process using path, through a lock file next to it.
+    The data file itself cannot be locked, as atomic writes replace it with a new file.
+    """
+    with open(path + '.lock', 'a+') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after about ten seconds of retrying
+                    time.sleep(0.1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
 
 
 def replace_placing(data, difficulty, name, time):
-    for i, info in enumerate(data[difficulty]):
-        if time < info['time']:
-            data[difficulty].insert(i, {'name': name, 'time': time})
-            data[difficulty].pop(-1)
-            break
+    return data[difficulty].insert(name, time)
 
 
 def check_ranking(data, difficulty, time):
-    rank = -1
-    for rnk, info in enumerate(data[difficulty]):
-        if time < info['time']:
-            rank = rnk
-            break
-    return rank
+    return data[difficulty].rank(time)
+
+
+class HighScoreStore:
+    """The high scores of the file at path. New placings are applied in memory at once, and merged into the file
+    on a background thread.
+
+    Attributes
+    ----------
+    data: dict
+        The Leaderboard of each difficulty. Call revalidate before reading it to pick up changes made by other
+        instances
+    """
+
+    def __init__(self, path, depth=DEPTH):
+        self.path = path
+        self.depth = depth
+        self.data = default_highscores(depth)
+        self._signature = None
+        # Placings not merged into the file yet, as (difficulty, name, time)
+        self._pending = []
+        self._writing = False
+        self._condition = threading.Condition()
+
+        with file_lock(path):
+            if not os.path.exists(path):
+                print('Missing High Score file. Generating one. ')
+                generate_highscore_file(path)
+        self.revalidate()
+
+        self._thread = threading.Thread(target=self._run, name='highscore', daemon=True)
+        self._thread.start()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def revalidate(self):
+        """Reread the file only if its modification time or size changed since it was last read.
+
+        Returns
+        -------
+        bool: True if the scores were reread
+        """
+        if self._stat() == self._signature:
+            return False
+        # The worker writes the file and drops the placings it wrote from the pending ones while holding the lock,
+        # so the file read here and the pending placings never both hold the same placing
+        with file_lock(self.path):
+            signature = self._stat()
+            try:
+                data = read_highscore_file(self.path, self.depth)
+            except OSError as e:
+                print('Cannot open the high score file, using the default scores:', e)
+                data = default_highscores(self.depth)
+            with self._condition:
+                pending = list(self._pending)
+        for difficulty, name, tenths in pending:
+            replace_placing(data, difficulty, name, tenths)
+        self.data = data
+        self._signature = signature
+        return True
+
+    def rank(self, difficulty, time):
+        return check_ranking(self.data, difficulty, time)
+
+    def insert(self, difficulty, name, time):
+        """Add a placing, and queue it to be merged into the file
+
+        Returns
+        -------
+        int: The 0-based rank taken, or -1 if the time was not kept
+        """
+        rank = replace_placing(self.data, difficulty, name, time)
+        if rank >= 0:
+            with self._condition:
+                self._pending.append((difficulty, name, time))
+                self._condition.notify()
+        return rank
+
+    def flush(self, timeout=None):
+        """Block until every placing has been merged into the file, or the timeout in seconds runs out
+
+        Returns
+        -------
+        bool: True if every placing was written
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+                ops = list(self._pending)
+                self._writing = True
+            written = False
+            try:
+                with file_lock(self.path):
+                    try:
+                        data = read_highscore_file(self.path, self.depth)
+                    except OSError:
+                        data = default_highscores(self.depth)
+                    for difficulty, name, tenths in ops:
+                        replace_placing(data, difficulty, name, tenths)
+                    write_highscore_file(self.path, data)
+                    with self._condition:
+                        del self._pending[:len(ops)]
+                    written = True
+            except OSError as e:
+                print('Saving the high scores failed, retrying:', e)
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+                if not written:
+                    # The placings stay pending, and are written again after a pause
+                    self._condition.wait(RETRY_DELAY)
 
 
 if __name__ == "__main__":
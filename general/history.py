@@ -0,0 +1,224 @@
+"""A log of every finished game, with summaries per difficulty that are kept up to date as games are added.
+
+The log is a binary file of fixed-size records, only ever appended to. Next to it, a JSON sidecar stores the
+summaries together with the log offset they cover, so opening the history only reads the records appended
+since the sidecar was last written. The median and 90th percentile are estimated with the P-square algorithm
+(Jain and Chlamtac, 1985), which keeps five markers per quantile instead of every time.
+"""
+import json
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .extras import write_atomic
+from .highscore import DIFFICULTIES, file_lock
+
+# difficulty, givens, hints used, moves, solve time in tenths of a second, finish time in Unix seconds
+RECORD = struct.Struct('<BBHIII')
+SIDECAR_VERSION = 1
+
+
+class P2Quantile:
+    """Streaming estimate of one quantile in constant memory"""
+
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        h = self.heights
+        if len(h) < 5:
+            h.append(x)
+            h.sort()
+            return
+
+        if x < h[0]:
+            h[0] = x
+            k = 0
+        elif x >= h[4]:
+            h[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= h[k + 1]:
+                k += 1
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                # Piecewise parabolic prediction, falling back to linear if it breaks the ordering
+                q = h[i] + d / (n[i + 1] - n[i - 1]) * ((n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+                                                        + (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1]))
+                if not h[i - 1] < q < h[i + 1]:
+                    q = h[i] + d * (h[i + d] - h[i]) / (n[i + d] - n[i])
+                h[i] = q
+                n[i] += d
+
+    def value(self):
+        h = self.heights
+        if not h:
+            return 0
+        if len(h) < 5:
+            return h[min(len(h) - 1, int(self.p * len(h)))]
+        return h[2]
+
+    def state(self):
+        return {'p': self.p, 'heights': self.heights, 'positions': self.positions, 'desired': self.desired}
+
+    @classmethod
+    def from_state(cls, state):
+        estimator = cls(state['p'])
+        estimator.heights = state['heights']
+        estimator.positions = state['positions']
+        estimator.desired = state['desired']
+        return estimator
+
+
+class DifficultyStats:
+    """Running summary of the games of one difficulty"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.best = None
+        self.p50 = P2Quantile(0.5)
+        self.p90 = P2Quantile(0.9)
+
+    def add(self, solve_time):
+        self.count += 1
+        self.mean += (solve_time - self.mean) / self.count
+        if self.best is None or solve_time < self.best:
+            self.best = solve_time
+        self.p50.add(solve_time)
+        self.p90.add(solve_time)
+
+    def summary(self):
+        """Get the summary with times in tenths of a second"""
+        return {'count': self.count, 'mean': round(self.mean), 'best': self.best,
+                'p50': round(self.p50.value()), 'p90': round(self.p90.value())}
+
+    def state(self):
+        return {'count': self.count, 'mean': self.mean, 'best': self.best,
+                'p50': self.p50.state(), 'p90': self.p90.state()}
+
+    @classmethod
+    def from_state(cls, state):
+        stats = cls()
+        stats.count = state['count']
+        stats.mean = state['mean']
+        stats.best = state['best']
+        stats.p50 = P2Quantile.from_state(state['p50'])
+        stats.p90 = P2Quantile.from_state(state['p90'])
+        return stats
+
+
+class GameHistory:
+    """The game log and its summaries. Records are written on a worker thread; the summaries are updated at once.
+    """
+
+    def __init__(self, path):
+        """Open the log, catching the summaries up with any records the sidecar does not cover yet
+
+        Parameters
+        ----------
+        path: str
+            Path of the log. The sidecar is the same path with '.json' appended
+        """
+        self.path = path
+        self.sidecar_path = path + '.json'
+        self.stats = [DifficultyStats() for _ in DIFFICULTIES]
+        self.offset = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='history')
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.sidecar_path, 'r') as f:
+                sidecar = json.load(f)
+            if sidecar['version'] == SIDECAR_VERSION:
+                self.stats = [DifficultyStats.from_state(state) for state in sidecar['stats']]
+                self.offset = sidecar['offset']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        if size < self.offset:
+            # The log was replaced, so the summaries are rebuilt from it
+            self.stats = [DifficultyStats() for _ in DIFFICULTIES]
+            self.offset = 0
+        if size - self.offset >= RECORD.size:
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read(size - self.offset)
+            complete = len(data) - len(data) % RECORD.size
+            for record in RECORD.iter_unpack(data[:complete]):
+                self._add(*record)
+            self.offset += complete
+            self._executor.submit(self._write_sidecar, self._sidecar())
+
+    def _add(self, difficulty, givens, hints, moves, solve_time, finished_at):
+        if 0 <= difficulty < len(self.stats):
+            self.stats[difficulty].add(solve_time)
+
+    def _sidecar(self):
+        return json.dumps({'version': SIDECAR_VERSION, 'offset': self.offset,
+                           'stats': [stats.state() for stats in self.stats]})
+
+    def record_game(self, difficulty, solve_time, givens, moves, hints):
+        """Add a finished game
+
+        Parameters
+        ----------
+        difficulty: int
+            The difficulty level
+        solve_time: int
+            Time taken, in tenths of a second
+        givens, moves, hints: int
+            Number of given cells, digits entered and hints used
+        """
+        record = (difficulty, givens, min(hints, 0xffff), moves, solve_time, int(time.time()))
+        self._add(*record)
+        self.offset += RECORD.size
+        self._executor.submit(self._append, RECORD.pack(*record), self._sidecar(), self.offset)
+
+    def summary(self, difficulty):
+        """Get the count, mean, best, p50 and p90 of a difficulty, with times in tenths of a second"""
+        return self.stats[difficulty].summary()
+
+    def flush(self):
+        """Block until every record has been written"""
+        self._executor.submit(lambda: None).result()
+
+    def _append(self, data, sidecar, offset):
+        try:
+            with file_lock(self.path):
+                with open(self.path, 'ab') as f:
+                    f.write(data)
+                    size = f.tell()
+                if size == offset:
+                    self._write_sidecar(sidecar)
+                elif os.path.exists(self.sidecar_path):
+                    # Another instance appended games too, so the summaries here miss some. Dropping the sidecar
+                    # makes the next start rebuild them from the log
+                    os.remove(self.sidecar_path)
+        except OSError as e:
+            print('Saving the game history failed:', e)
+
+    def _write_sidecar(self, sidecar):
+        try:
+            write_atomic(self.sidecar_path, sidecar)
+        except OSError as e:
+            print('Saving the game history summary failed:', e)
@@ -8,6 +8,11 @@ from PySide2.QtCore import (QAbstractAnimation, Qt, QLineF, QPropertyAnimation,
 from . import sudoku_graphics as sdk_grap
 from . import menu_graphics as menu_grap
 
+INSTRUCTION = "Hold M to scribble down numbers in a cell"
+DEAD_END = "No solution from here. Try undoing some moves"
+STRICT_ON = "Strict mode: wrong digits are marked at once"
+STRICT_OFF = "Strict mode off: only clashing digits are marked"
+
 
 class BoxBoard(QGraphicsWidget):
     """A generic board that draws an animated rectangular border
@@ -121,12 +126,21 @@ class GameBoard(BoxBoard):
         Emitted when the difficulty is selected from here. Emits the difficulty string
     gridDrawn: Signal
         Emitted when the Sudoku grid has been drawn
-    sudokuDone: Signal
-        Emitted when the Sudoku puzzle is finished
+    sudokuDone: Signal(int, int, int)
+        Emitted when the Sudoku puzzle is finished. Emits the number of givens, moves and hints used
+    sudokuRevealed: Signal
+        Emitted when the Sudoku puzzle is finished by revealing the solution
+    boardChanged: Signal
+        Emitted when the player changes the grid
+    gameResumed: Signal(str)
+        Emitted when a saved game is resumed. Emits the difficulty string
     """
     newGameSelected = Signal(str)
     gridDrawn = Signal()
-    sudokuDone = Signal()
+    sudokuDone = Signal(int, int, int)
+    sudokuRevealed = Signal()
+    boardChanged = Signal()
+    gameResumed = Signal(str)
 
     def __init__(self, width, height, parent=None):
         """Create the game area consisting of a Sudoku Grid and a Number Ring,
@@ -153,12 +167,18 @@ class GameBoard(BoxBoard):
 
         self.gamegrid.buttonClicked.connect(self.show_number_ring)
         self.gamegrid.finishDrawing.connect(self.gridDrawn.emit)
-        self.gamegrid.puzzleFinished.connect(self.sudokuDone.emit)
+        self.gamegrid.puzzleFinished.connect(self.finish_game)
+        self.gamegrid.puzzleRevealed.connect(self.sudokuRevealed.emit)
+        self.gamegrid.gridChanged.connect(self.boardChanged.emit)
+        self.gamegrid.gridChanged.connect(lambda: self.show_message(INSTRUCTION))
+        self.gamegrid.hintShown.connect(self.show_message)
+        self.gamegrid.deadEndFound.connect(lambda: self.show_message(DEAD_END))
         self.numring.loseFocus.connect(self.game_refocus)
         self.numring.keyPressed.connect(self.select_ring_number)
         self.playmenu.buttonClicked.connect(self.new_game)
 
-        self.anim.finished.connect(lambda: self.show_playmenu(True))
+        self.message = INSTRUCTION
+        self.anim.finished.connect(lambda: self.show_playmenu(not self.gamegrid.isVisible()))
         self.toggle_anim(True)
 
         self.refocus_timer = QTimer()
@@ -202,6 +222,72 @@ class GameBoard(BoxBoard):
         else:
             self.gamegrid.replace_cell_number(int(val))
 
+    def finish_game(self):
+        """Emit sudokuDone with how the finished puzzle was played
+        """
+        grid = self.gamegrid.sudoku_grid
+        self.sudokuDone.emit(grid.givens, grid.moves, self.gamegrid.hints_used)
+
+    def in_play(self):
+        """Check whether the grid takes input: it is shown, the Number Ring is closed and the puzzle is unfinished
+        """
+        return (self.gamegrid.isVisible() and not self.numring.isVisible()
+                and not self.gamegrid.sudoku_grid.is_solved())
+
+    def toggle_auto_notes(self):
+        """Show or hide the automatic candidates, if the grid is visible
+        """
+        if self.gamegrid.isVisible():
+            self.gamegrid.toggle_auto_candidates()
+
+    def show_hint(self):
+        """Ask the grid for a hint, if the grid is in play
+        """
+        if self.gamegrid.isVisible() and not self.numring.isVisible():
+            self.gamegrid.show_hint()
+
+    def toggle_strict(self):
+        """Turn the immediate marking of wrong digits on or off, if the grid is visible
+        """
+        if self.gamegrid.isVisible():
+            self.gamegrid.toggle_strict()
+            self.show_message(STRICT_ON if self.gamegrid.sudoku_grid.strict else STRICT_OFF)
+
+    def reveal_cell(self):
+        """Reveal the digit of the cell under the mouse, if the grid is in play
+        """
+        if self.gamegrid.isVisible() and not self.numring.isVisible():
+            self.gamegrid.reveal_cell()
+
+    def auto_solve(self):
+        """Reveal the whole solution, if the grid is in play
+        """
+        if self.gamegrid.isVisible() and not self.numring.isVisible():
+            self.gamegrid.auto_solve()
+
+    def show_message(self, text):
+        """Set the message shown under the grid
+
+        Parameters
+        ----------
+        text: str
+            The message to show
+        """
+        self.message = text
+        self.update()
+
+    def undo_move(self):
+        """Revert the last edit, if the grid is in play
+        """
+        if self.gamegrid.isVisible() and not self.numring.isVisible():
+            self.gamegrid.undo()
+
+    def redo_move(self):
+        """Reapply the last reverted edit, if the grid is in play
+        """
+        if self.gamegrid.isVisible() and not self.numring.isVisible():
+            self.gamegrid.redo()
+
     def game_refocus(self):
         """Enable the grid and give it grid focus
         """
@@ -250,15 +336,29 @@ class GameBoard(BoxBoard):
             The difficulty e.g. Easy
         """
         self.gamegrid.generate_new_grid(menu_grap.DIFFICULTIES.index(string))
+        self.show_message(INSTRUCTION)
         self.show_grid(True)
         self.newGameSelected.emit(string)
 
+    def resume_game(self, hints_used=0):
+        """Show the grid with the game already loaded into it, skipping the play menu
+
+        Parameters
+        ----------
+        hints_used: int
+            Number of hints used in the game so far
+        """
+        self.gamegrid.hints_used = hints_used
+        self.show_playmenu(False)
+        self.show_grid(True)
+        self.gamegrid.board_changed()
+        self.gameResumed.emit(menu_grap.DIFFICULTIES[self.gamegrid.sudoku_grid.difficulty])
+
     def paint(self, painter, style, widget=None):
-        """Reimplemented from BoxBoard paint method. Draw the instruction to toggle scribble mode """
+        """Reimplemented from BoxBoard paint method. Draw the instruction to toggle scribble mode, or the hint """
         super().paint(painter, style, widget)
 
-        painter.drawText(QRectF(0, self.height+15, self.width, 15), Qt.AlignCenter,
-                         "Hold M to scribble down numbers in a cell")
+        painter.drawText(QRectF(0, self.height+15, self.width, 15), Qt.AlignCenter, self.message)
 
 
 class MenuBoard(BoxBoard):
@@ -274,6 +374,9 @@ class MenuBoard(BoxBoard):
 
         # Create the components and manually position them
         # Not bothered to use the layout item
+        # Time to start the timer from, when resuming a saved game
+        self.start_time = 0
+
         self.diff_display = menu_grap.DifficultyDisplayer(parent=self)
         self.diff_display.setX(self.margin)
         self.diff_display.setY(self.geometry().height()/2-self.diff_display.height/2)
@@ -285,7 +388,7 @@ class MenuBoard(BoxBoard):
         self.score_display.setX(self.width - self.margin)
         self.score_display.setY(self.height - self.margin)
 
-        self.score_display.scoreboard_widget.highScoreSet.connect(self.return_to_normal)
+        self.score_display.highScoreSet.connect(self.return_to_normal)
 
         self.show_children(False)
         self.toggle_anim(True)
@@ -300,25 +403,55 @@ class MenuBoard(BoxBoard):
         """
         self.timer_display.setVisible(state)
         self.diff_display.setVisible(state)
-        self.timer_display.reset_time()
+        self.timer_display.reset_time(self.start_time)
 
     def set_difficulty_text(self, string):
         """Change the difficulty to be display and reset the timer
         """
+        self.start_time = 0
         self.diff_display.set_text(string)
         self.timer_display.reset_time()
 
-    def finish_the_game(self):
-        """Stop the timer and prepare the high scores if necessary. Should only happen when the puzzle is finished
+    def resume_game(self, string, elapsed):
+        """Display the difficulty of a resumed game and continue its timer
+
+        Parameters
+        ----------
+        string: str
+            The difficulty e.g. Easy
+        elapsed: int
+            Time already spent on the game, in tenths of a second
         """
-        self.timer_display.timer.stop()
+        self.diff_display.set_text(string)
+        self.start_time = elapsed
+        self.timer_display.reset_time(elapsed)
+
+    def finish_the_game(self, givens, moves, hints):
+        """Stop the timer, log the game and prepare the high scores if necessary. Should only happen when the puzzle
+        is finished
+
+        Parameters
+        ----------
+        givens: int
+            Number of given cells in the puzzle
+        moves: int
+            Number of digits entered
+        hints: int
+            Number of hints used
+        """
+        self.timer_display.stop()
         diff = self.diff_display.text
-        time = self.timer_display.get_time()
-        if self.score_display.scoreboard_widget.check_ranking(diff, time):
+        time = self.timer_display.get_tenths()
+        if self.score_display.record_game(diff, time, givens, moves, hints):
             self.diff_display.set_disabled(True)
             self.score_display.set_disabled(True)
             self.score_display.show_board(True)
 
+    def stop_the_game(self):
+        """Stop the timer without checking for a high score, e.g. when the solution was revealed
+        """
+        self.timer_display.stop()
+
     def return_to_normal(self):
         """Re-enable the difficulty and high score buttons. Used after setting the high scores
         """
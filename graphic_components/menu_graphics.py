@@ -3,11 +3,13 @@ This module contains the components that make up the menu Board
 """
 
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from PySide2.QtCore import (Qt, QRectF, Signal, QSizeF, QTimer)
 from PySide2.QtGui import QPainter, QBrush, QPen
 from PySide2.QtWidgets import (QSizePolicy, QGraphicsWidget, QGraphicsItem, QGraphicsObject, QGraphicsProxyWidget, QGraphicsScene, QGraphicsView, QApplication)
-from general.highscore import DIFFICULTIES
+from general.highscore import DIFFICULTIES, format_time
 
 if __name__ == "__main__":
     import buttons
@@ -19,6 +21,14 @@ else:
 
 class TimerDisplayer(QGraphicsWidget):
     """The widget to display the elapsed time. Unit of time is a tenth of a second.
+    The time is measured on the monotonic clock, so late or skipped QTimer ticks do not make it drift. A single shot
+    QTimer, aimed at the next tenth of a second, only refreshes the display while the clock runs and the widget is
+    visible.
+
+    Attributes
+    ----------
+    move_times: list
+        The time of each move of the current game, in tenths of a second
     """
     def __init__(self, parent=None):
         """Set up the box to draw and the time string with the QTimer
@@ -45,23 +55,95 @@ class TimerDisplayer(QGraphicsWidget):
         self.size_policy.setHeightForWidth(True)
         self.setSizePolicy(self.size_policy)
 
-        self.atenth_seconds = 0
+        # Seconds counted before the clock was last started, and the monotonic time it was started at
+        self.elapsed = 0.0
+        self.started = None
+        self.paused = False
+        self.shown_time = None
+        self.move_times = []
+
         self.timer = QTimer()
-        self.timer.setInterval(100)
-        self.timer.timeout.connect(self._increase_time)
-        self.timer.start()
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self._refresh)
+        self.reset_time()
 
-    def _increase_time(self):
-        """Increase the time. Connected to the QTimer.
+    def _schedule(self):
+        """Start the QTimer for the moment the displayed tenth changes, if the clock runs and the widget is visible
         """
-        self.atenth_seconds += 1
-        self.update()
+        if self.started is None or not self.isVisible():
+            self.timer.stop()
+            return
+        elapsed_ms = int((self.elapsed + time.monotonic() - self.started) * 1000)
+        self.timer.start(100 - elapsed_ms % 100 + 1)
+
+    def _refresh(self):
+        """Repaint if the displayed time has changed, and wait for the next tenth. Connected to the QTimer.
+        """
+        if self.get_time() != self.shown_time:
+            self.update()
+        self._schedule()
+
+    def itemChange(self, change, value):
+        """Reimplemented from QGraphicsWidget. Stop the QTimer while hidden, and catch up when shown again.
+        """
+        if change == QGraphicsItem.ItemVisibleHasChanged:
+            if value:
+                self._refresh()
+            else:
+                self.timer.stop()
+        return super().itemChange(change, value)
+
+    def reset_time(self, tenths=0):
+        """Reset the time and start the clock
+
+        Parameters
+        ----------
+        tenths: int
+            The time to start from, in tenths of a second
+        """
+        self.elapsed = tenths / 10
+        self.started = time.monotonic()
+        self.paused = False
+        self.move_times = []
+        self._refresh()
+
+    def stop(self):
+        """Stop the clock, e.g. when the game is over
+        """
+        if self.started is not None:
+            self.elapsed += time.monotonic() - self.started
+            self.started = None
+        self.paused = False
+        self._refresh()
+
+    def pause(self):
+        """Stop the clock until resume is called. Does nothing if the clock is stopped
+        """
+        if self.started is not None:
+            self.stop()
+            self.paused = True
+
+    def resume(self):
+        """Restart the clock if it was paused
+        """
+        if self.paused:
+            self.paused = False
+            self.started = time.monotonic()
+            self._refresh()
+
+    def mark_move(self):
+        """Record the time of a move
+        """
+        self.move_times.append(self.get_tenths())
 
-    def reset_time(self):
-        """Reset the time to 0 and start the QTimer
+    def get_tenths(self):
+        """Get the elapsed time in tenths of a second
         """
-        self.atenth_seconds = 0
-        self.timer.start()
+        elapsed = self.elapsed
+        if self.started is not None:
+            elapsed += time.monotonic() - self.started
+        return int(elapsed * 10)
 
     def get_time(self):
         """Get the time formatted as such: (minutes):(seconds):(A tenth of a second)
@@ -70,9 +152,7 @@ class TimerDisplayer(QGraphicsWidget):
         -------
         str: the formatted time string
         """
-        return "{:02d}:{:02d}:{:1d}".format(int(self.atenth_seconds/600),
-                                            int(self.atenth_seconds/10) % 60,
-                                            self.atenth_seconds % 10)
+        return format_time(self.get_tenths())
 
     def paint(self, painter, style, widget=None):
         """Reimplemented from QGraphicsWidget. Draw the box and the timer.
@@ -80,7 +160,8 @@ class TimerDisplayer(QGraphicsWidget):
         box = self.timer_box
         painter.setPen(self.box_pen)
         painter.drawRect(box)
-        painter.drawText(box, Qt.AlignCenter, self.get_time())
+        self.shown_time = self.get_time()
+        painter.drawText(box, Qt.AlignCenter, self.shown_time)
 
 
 class DifficultyDisplayer(QGraphicsWidget):
@@ -262,9 +343,18 @@ class DifficultyMenu(QGraphicsWidget):
 
 
 class HighScoreDisplayer(QGraphicsObject):
+    """The icon that shows the score board on hover. The score data is loaded on a worker thread as soon as the
+    icon is created, but the score board itself is only built the first time it is needed.
+
+    Attributes
+    ----------
+    highScoreSet: Signal
+        Emitted once a high score is set on the score board
+    """
+    highScoreSet = Signal()
 
     def __init__(self, parent=None):
-        """Creates the five difficulty buttons
+        """Start loading the score data and prepare the icon
 
         Parameters
         ----------
@@ -282,21 +372,52 @@ class HighScoreDisplayer(QGraphicsObject):
         self.pen_width = 3
         self.box_pen.setWidth(self.pen_width)
 
-        self.widget_proxy = QGraphicsProxyWidget(parent=self)
-        self.scoreboard_widget = scb.HighScoreBoard(self.board_size, self.board_size)
-        self.widget_proxy.setWidget(self.scoreboard_widget)
-        self.widget_proxy.setPos(-self.board_size, -self.board_size)
-        self.scoreboard_widget.setVisible(False)
+        loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='scores')
+        self.score_data = loader.submit(scb.load_score_data)
+        loader.shutdown(wait=False)
+        self.widget_proxy = None
+        self.scoreboard_widget = None
 
         self.setAcceptHoverEvents(True)
         self.selected = False
 
+    def get_scoreboard(self):
+        """Get the score board, building it on first use. Waits for the score data if it is still loading.
+        """
+        if self.scoreboard_widget is None:
+            self.scoreboard_widget = scb.HighScoreBoard(self.board_size, self.board_size, *self.score_data.result())
+            self.scoreboard_widget.setVisible(False)
+            self.scoreboard_widget.highScoreSet.connect(self.highScoreSet.emit)
+            self.widget_proxy = QGraphicsProxyWidget(parent=self)
+            self.widget_proxy.setWidget(self.scoreboard_widget)
+            self.widget_proxy.setPos(-self.board_size, -self.board_size)
+        return self.scoreboard_widget
+
+    def record_game(self, difficulty, time, givens, moves, hints):
+        """Log a finished game and check whether its time ranks. See HighScoreBoard.record_game and check_ranking
+
+        Returns
+        -------
+        bool: True if the time ranks on the board, False otherwise
+        """
+        scoreboard = self.get_scoreboard()
+        scoreboard.record_game(difficulty, time, givens, moves, hints)
+        return scoreboard.check_ranking(difficulty, time)
+
+    def flush_scores(self):
+        """Block until the score data is written. Nothing can be pending if the board was never built
+        """
+        if self.scoreboard_widget is not None:
+            self.scoreboard_widget.flush_scores()
+
     def set_disabled(self, state):
         self.setAcceptHoverEvents(not state)
 
     def show_board(self, state):
-        self.scoreboard_widget.setVisible(state)
-        self.scoreboard_widget.show_scores(state)
+        if state or self.scoreboard_widget is not None:
+            scoreboard = self.get_scoreboard()
+            scoreboard.setVisible(state)
+            scoreboard.show_scores(state)
         self.prepareGeometryChange()
         if state:
             self.size = self.board_size
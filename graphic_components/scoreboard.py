@@ -1,5 +1,7 @@
 """This module contains the components that makes up the score board. It is constructed using QWigdets
-and then embedded into the QGraphicsScene using QGraphicsProxyWidget because it's easier."""
+and then embedded into the QGraphicsScene using QGraphicsProxyWidget because it's easier.
+
+Importing it does no file I/O: the score data is read by load_score_data, which can run off the GUI thread."""
 
 import sys
 import os
@@ -8,29 +10,41 @@ from PySide2.QtCore import (QAbstractAnimation, Qt, QPropertyAnimation, Property
 from PySide2.QtWidgets import (QWidget, QLineEdit, QHBoxLayout, QGridLayout, QVBoxLayout, QPushButton, QLabel, QApplication)
 
 from general import highscore as hs
+from general import history
 from .textbox import AnimatedLabel
 
 if not __name__ == "__main__":
     current_dir = os.getcwd()
     sys.path.append(current_dir)
     hs_file = current_dir + "/general/highscore.txt"
+    history_file = current_dir + "/general/history.bin"
 else:
     # For testing, maybe wrong
     hs_file = "../general/highscore.txt"
+    history_file = "../general/history.bin"
 
 
-if not os.path.exists(hs_file):
-    print('Missing High Score file. Generating one. ')
-    hs.generate_highscore_file(hs_file)
-
 BACKWARD = 1
 FORWARD = -1
 
+# Number of placings shown on one page of the score board
+PAGE_SIZE = 5
+
+
+def load_score_data():
+    """Read the high scores, generating the file if it is missing, and open the game history.
+
+    Returns
+    -------
+    (HighScoreStore, GameHistory): The high scores, and the game history
+    """
+    return hs.HighScoreStore(hs_file), history.GameHistory(history_file)
+
 
 class HighScoreBoard(QWidget):
     highScoreSet = Signal()
 
-    def __init__(self, width, height):
+    def __init__(self, width, height, highscore_store, game_history):
         """Initialise the widget with the specified width and height.
 
         Parameters
@@ -39,10 +53,14 @@ class HighScoreBoard(QWidget):
             width of the widget
         height: float
             height of the widget
+        highscore_store: HighScoreStore
+            The high scores, see load_score_data
+        game_history: GameHistory
+            The log of finished games
         """
         super().__init__()
 
-        self.final_time = "00:10:00"
+        self.final_time = 6000
         self.current_difficulty = hs.DIFFICULTIES[1]
 
         self.layout = QVBoxLayout(self)
@@ -50,11 +68,16 @@ class HighScoreBoard(QWidget):
         self.layout.addWidget(QLabel('Score Board', self, alignment=Qt.AlignCenter))
         self.diff_switch = DifficultySwitch()
         self.layout.addLayout(self.diff_switch)
-        self.score_grid = ScoreGrid()
+        self.score_grid = ScoreGrid(highscore_store)
         self.layout.addLayout(self.score_grid)
         self.name_input = NameInput()
         self.layout.addWidget(self.name_input)
         self.name_input.setVisible(False)
+        self.summary_label = QLabel('', self, alignment=Qt.AlignCenter)
+        self.layout.addWidget(self.summary_label)
+
+        self.history = game_history
+        self.show_summary(self.score_grid.difficulty)
 
         self.setFixedSize(width, height)
         self.setStyleSheet("""background-color: rgb(0, 0, 0);
@@ -74,6 +97,43 @@ class HighScoreBoard(QWidget):
             The difficulty for the score board to change to
         """
         self.score_grid.replace_scores(difficulty)
+        self.show_summary(difficulty)
+
+    def show_summary(self, difficulty):
+        """Show the number of games, mean, median, 90th percentile and best times of a difficulty
+
+        Parameters
+        ----------
+        difficulty: str
+            The difficulty to summarise
+        """
+        summary = self.history.summary(hs.DIFFICULTIES.index(difficulty))
+        if not summary['count']:
+            self.summary_label.setText('No games finished yet')
+            return
+        self.summary_label.setText('{} games  best {}\nmean {}  p50 {}  p90 {}'.format(
+            summary['count'], hs.format_time(summary['best']), hs.format_time(summary['mean']),
+            hs.format_time(summary['p50']), hs.format_time(summary['p90'])))
+
+    def record_game(self, difficulty, time, givens, moves, hints):
+        """Add a finished game to the history and update its summary
+
+        Parameters
+        ----------
+        difficulty: str
+            Difficulty of the puzzle
+        time: int
+            The time taken to solve the puzzle, in tenths of a second
+        givens, moves, hints: int
+            Number of given cells, digits entered and hints used
+        """
+        self.history.record_game(hs.DIFFICULTIES.index(difficulty), time, givens, moves, hints)
+        self.show_summary(difficulty)
+
+    def wheelEvent(self, event):
+        """Reimplemented from QWidget. Scroll through the pages of placings
+        """
+        self.score_grid.turn_page(1 if event.angleDelta().y() < 0 else -1)
 
     def show_scores(self, toggle):
         """Shows the score board in the current difficulty, if the widget is visible
@@ -99,31 +159,39 @@ class HighScoreBoard(QWidget):
         self.name_input.setVisible(False)
         self.highScoreSet.emit()
 
+    def flush_scores(self):
+        """Block until the high scores and games recorded so far are written to their files
+        """
+        if not self.score_grid.store.flush(hs.RETRY_DELAY * 5):
+            print('Some high scores could not be saved')
+        self.history.flush()
+
     def check_ranking(self, difficulty, time):
         """First, it updates the current difficulty and time. Check if the current time ranks in the Top 5.
-        If so, display the score board in the correct difficulty.
+        If so, display the score board in the correct difficulty, at the page of the rank.
 
         Parameters
         ----------
         difficulty: str
             Current difficulty of the puzzle
 
-        time: str
-            The time taken to solve the puzzle
+        time: int
+            The time taken to solve the puzzle, in tenths of a second
 
         Returns
         -------
-        bool: True if it ranks Top 5, False otherwise
+        bool: True if it ranks on the board, False otherwise
         """
         self.current_difficulty = difficulty
         self.final_time = time
         rank = self.score_grid.get_rank(difficulty, time)
         if rank >= 0:
             self.diff_switch.go_to_difficulty(difficulty)
-            self.score_grid.replace_scores(difficulty)
+            self.score_grid.replace_scores(difficulty, rank // PAGE_SIZE)
+            self.show_summary(difficulty)
             self.name_input.setVisible(True)
             self.name_input.rank_label.setText(str(rank+1))
-            self.name_input.time_display.setText(time)
+            self.name_input.time_display.setText(hs.format_time(time))
             return True
         return False
 
@@ -242,7 +310,7 @@ class DifficultySwitch(QHBoxLayout):
 
 
 class ScoreGrid(QGridLayout):
-    """The layout that displays the score data.
+    """The layout that displays the score data, one page of placings at a time.
 
     Attributes
     ----------
@@ -251,18 +319,24 @@ class ScoreGrid(QGridLayout):
     """
     scoreUpdate = Signal(str)
 
-    def __init__(self):
-        """Read the high score file, create the animated labels to contain the data.
+    def __init__(self, highscore_store):
+        """Create the animated labels to contain the data.
+
+        Parameters
+        ----------
+        highscore_store: HighScoreStore
+            The high scores
         """
         super().__init__()
-        try:
-            self.highscore_list = hs.read_highscore_file(hs_file)
-        except Exception as e:
-            raise Exception('Cannot open file', e)
+        self.store = highscore_store
 
-        for i in range(5):
+        self.difficulty = hs.DIFFICULTIES[0]
+        self.page = 0
+        self.rank_labels = []
+        for i in range(PAGE_SIZE):
             label = QLabel(str(i+1)+'.')
             self.addWidget(label, i, 0)
+            self.rank_labels.append(label)
 
         # The labels are created with placeholder text.
         self.animated_labels = []
@@ -286,24 +360,49 @@ class ScoreGrid(QGridLayout):
         toggle: bool
             True to show data, False otherwise
         """
+        if toggle and self.store.revalidate():
+            # Another instance of the game changed the scores
+            self.replace_scores(self.difficulty, self.page)
         for label in self.animated_labels:
             label.toggle_anim(toggle)
 
-    def replace_scores(self, difficulty):
-        """Replace the current scores with data from the selected difficulty
+    def replace_scores(self, difficulty, page=0):
+        """Replace the current scores with a page of data from the selected difficulty
 
         Parameters
         ----------
         difficulty: str
             The difficulty to show
+        page: int
+            The page of placings to show, from 0
+        """
+        self.difficulty = difficulty
+        self.page = page
+        start = page * PAGE_SIZE
+        scores = self.store.data[difficulty].page(start, PAGE_SIZE)
+        for i in range(PAGE_SIZE):
+            self.rank_labels[i].setText(str(start+i+1)+'.')
+            if i < len(scores):
+                self.animated_labels[2*i].replace_text(scores[i]['name'])
+                self.animated_labels[2*i+1].replace_text(hs.format_time(scores[i]['time']))
+            else:
+                self.animated_labels[2*i].replace_text('-')
+                self.animated_labels[2*i+1].replace_text('--:--')
+
+    def turn_page(self, step):
+        """Show the next or previous page of the current difficulty, if there is one
+
+        Parameters
+        ----------
+        step: int
+            1 for the next page, -1 for the previous one
         """
-        scores = self.highscore_list[difficulty]
-        for i in range(len(scores)):
-            self.animated_labels[2*i].replace_text(scores[i]['name'])
-            self.animated_labels[2*i+1].replace_text(scores[i]['time'])
+        page = self.page + step
+        if 0 <= page and page * PAGE_SIZE < len(self.store.data[self.difficulty]):
+            self.replace_scores(self.difficulty, page)
 
     def set_highscore(self, difficulty, name, time):
-        """Set the high score with the given data
+        """Set the high score with the given data. It is merged into the file in the background
 
         Parameters
         ----------
@@ -311,12 +410,11 @@ class ScoreGrid(QGridLayout):
             The difficulty which the data is set to
         name: str
             Name to be set
-        time: str
-            Time to be set
+        time: int
+            Time to be set, in tenths of a second
         """
-        hs.replace_placing(self.highscore_list, difficulty, name, time)
-        hs.write_highscore_file(hs_file, self.highscore_list)
-        self.replace_scores(difficulty)
+        rank = self.store.insert(difficulty, name, time)
+        self.replace_scores(difficulty, max(rank, 0) // PAGE_SIZE)
         self.scoreUpdate.emit(difficulty)
 
     def get_rank(self, difficulty, time):
@@ -326,14 +424,15 @@ class ScoreGrid(QGridLayout):
         ----------
         difficulty: str
             The difficulty to check for
-        time: str
-            The time to be compared with
+        time: int
+            The time to be compared with, in tenths of a second
 
         Returns
         -------
-        int: The rank in the Top 5. -1 if it is out of Top 5
+        int: The rank from 0. -1 if it is not kept on the board
         """
-        return hs.check_ranking(self.highscore_list, difficulty, time)
+        self.store.revalidate()
+        return self.store.rank(difficulty, time)
 
 
 class NameInput(QWidget):
@@ -380,6 +479,6 @@ if __name__ == '__main__':
     app = 0
     app = QApplication(sys.argv)
 
-    ex = HighScoreBoard(500, 500)
+    ex = HighScoreBoard(500, 500, *load_score_data())
     ex.show()
     sys.exit(app.exec_())
@@ -2,12 +2,16 @@
 This module contains the components that make up the Sudoku Board
 """
 
+import math
+
 import numpy as np
 from PySide2.QtCore import (QAbstractAnimation, QPointF, Qt, QRectF, QLineF, QPropertyAnimation, Property, Signal)
-from PySide2.QtGui import QPen, QFont
+from PySide2.QtGui import QPen, QFont, QFontMetricsF, QPainter, QPixmap
 from PySide2.QtWidgets import QGraphicsItem, QGraphicsObject
 
 from gameplay import sudoku_gameplay as sdk
+from gameplay import hints
+from gameplay import deadend
 from general.extras import bound_value
 from . import buttons
 from . import menu_graphics as menu_grap
@@ -15,6 +19,13 @@ from . import menu_graphics as menu_grap
 # This key allows player to scribble on the board
 SCRIBBLE_KEY = Qt.Key_M
 
+# Scribbles are drawn on a circle around the cell centre. Offset of each scribbled digit from the centre
+SCRIBBLE_RADIUS = 15
+_angles = np.deg2rad(np.arange(10) * 360 / 10)
+SCRIBBLE_OFFSETS = tuple(zip((SCRIBBLE_RADIUS * np.sin(_angles)).tolist(),
+                             (-SCRIBBLE_RADIUS * np.cos(_angles)).tolist()))
+SCRIBBLE_STYLE = -1
+
 
 class BaseSudokuItem(QGraphicsObject):
 
@@ -41,9 +52,69 @@ class BaseSudokuItem(QGraphicsObject):
         self.freeze = False
 
 
+class GlyphCache:
+    """Digits pre-rendered into pixmaps, so painting a cell is a blit instead of laying out text.
+    Glyphs are keyed by digit and style, and rendered at the current device scale (view zoom times device pixel
+    ratio). A change of scale, from a resize or a move to another screen, drops them all.
+    """
+
+    def __init__(self):
+        self.scale = None
+        self._pixmaps = {}
+
+    def __len__(self):
+        return len(self._pixmaps)
+
+    def set_scale(self, scale):
+        """Set the device scale to render at, dropping the glyphs if it changed
+        """
+        if scale != self.scale:
+            self._pixmaps.clear()
+            self.scale = scale
+
+    def glyph(self, digit, style, pen, font):
+        """Get the pixmap of a digit, rendering it with the pen and font on first use
+
+        Parameters
+        ----------
+        digit: int
+            The digit
+        style: int
+            Key of the pen and font, e.g. the cell status
+        """
+        key = (digit, style)
+        pixmap = self._pixmaps.get(key)
+        if pixmap is None:
+            pixmap = self._render(str(digit), pen, font)
+            self._pixmaps[key] = pixmap
+        return pixmap
+
+    def _render(self, text, pen, font):
+        size = QFontMetricsF(font).size(Qt.TextSingleLine, text)
+        pixmap = QPixmap(max(1, math.ceil(size.width() * self.scale)), max(1, math.ceil(size.height() * self.scale)))
+        pixmap.setDevicePixelRatio(self.scale)
+        pixmap.fill(Qt.transparent)
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.TextAntialiasing)
+        painter.setPen(pen)
+        painter.setFont(font)
+        painter.drawText(QRectF(0, 0, size.width(), size.height()), Qt.AlignCenter, text)
+        painter.end()
+        return pixmap
+
+    def memory_bytes(self):
+        """Get the pixel memory held by the glyphs"""
+        return sum(pixmap.width() * pixmap.height() * pixmap.depth() // 8 for pixmap in self._pixmaps.values())
+
+    def report(self):
+        return '{} glyphs, {:.1f} KiB at scale {}'.format(len(self), self.memory_bytes() / 1024, self.scale)
+
+
 class NumberPainter(BaseSudokuItem):
     """The object to print the digits present in the grid. Does not draw the actual grids.
     Used as the component for SudokuGrid
+
+    Only the cells that changed are invalidated, and painting skips the cells outside the exposed rectangle.
     """
 
     def __init__(self, parent, grid):
@@ -72,11 +143,49 @@ class NumberPainter(BaseSudokuItem):
         # Used for scribbled digits by the player
         self.scribble_font = QFont("Helvetica", pointSize=8)
 
-    def paint(self, painter, style, widget=None):
-        """Reimplemented from QGraphicsObject to paint the digits
+        # The pen and font of each style of digit, and the glyphs rendered with them
+        self.styles = {sdk.VALID: (self.default_pen, self.default_font),
+                       sdk.INVALID: (self.invalid_pen, self.invalid_font),
+                       sdk.FIXED: (self.fixed_pen, self.fixed_font),
+                       SCRIBBLE_STYLE: (self.default_pen, self.scribble_font)}
+        self.glyph_cache = GlyphCache()
+
+        # Needed for the exposed rectangle to be passed into paint
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption, True)
+
+    def cell_rect(self, row, col):
+        """Get the area a cell paints into, including a margin for the scribbles
+
+        Returns
+        -------
+        QRectF: The area of the cell
+        """
+        return QRectF(col * self.parent.cell_width - 2, row * self.parent.cell_height - 2,
+                      self.parent.cell_width + 4, self.parent.cell_height + 4)
+
+    def refresh(self):
+        """Schedule a repaint of the cells that changed since the last refresh
         """
-        for i in range(9):
-            for j in range(9):
+        cells = self.sudoku_grid.take_dirty_cells()
+        if len(cells) == 81:
+            self.update()
+        else:
+            for i in cells:
+                self.update(self.cell_rect(i // 9, i % 9))
+
+    def paint(self, painter, style, widget=None):
+        """Reimplemented from QGraphicsObject to paint the digits of the cells within the exposed rectangle
+        """
+        exposed = style.exposedRect
+        cell_width = self.parent.cell_width
+        cell_height = self.parent.cell_height
+        first_col = bound_value(0, int(exposed.left() / cell_width), 8)
+        last_col = bound_value(0, int(exposed.right() / cell_width), 8)
+        first_row = bound_value(0, int(exposed.top() / cell_height), 8)
+        last_row = bound_value(0, int(exposed.bottom() / cell_height), 8)
+        self.glyph_cache.set_scale(round(painter.device().devicePixelRatioF() * painter.worldTransform().m11(), 3))
+        for i in range(first_col, last_col + 1):
+            for j in range(first_row, last_row + 1):
                 self._draw_number_cell(i, j, painter)
 
     def boundingRect(self):
@@ -84,9 +193,15 @@ class NumberPainter(BaseSudokuItem):
         """
         return QRectF(-5, -5, self.parent.width+10, self.parent.height+10)
 
+    def _draw_glyph(self, painter, digit, style, x, y):
+        """Blit the glyph of a digit centred on a point"""
+        pixmap = self.glyph_cache.glyph(digit, style, *self.styles[style])
+        scale = self.glyph_cache.scale
+        painter.drawPixmap(QPointF(x - pixmap.width() / scale / 2, y - pixmap.height() / scale / 2), pixmap)
+
     def _draw_number_cell(self, w, h, painter):
-        """Draw the digits(including scribbles) in a given cell, applying the correct pen depending
-        on the status of the cell
+        """Draw the digits(including scribbles) in a given cell, using the glyphs of the style matching
+        the status of the cell
 
         Parameters
         ----------
@@ -97,34 +212,16 @@ class NumberPainter(BaseSudokuItem):
         painter: QPainter
             Used to actually draw the digits
         """
-        val = self.sudoku_grid.get_cell_number(h, w)
-        if val == 0:
-            val = ''
-        else:
-            status = self.sudoku_grid.get_cell_status(h, w)
-            if status == sdk.VALID:
-                painter.setPen(self.default_pen)
-                painter.setFont(self.default_font)
-            elif status == sdk.FIXED:
-                painter.setPen(self.fixed_pen)
-                painter.setFont(self.fixed_font)
-            else:
-                painter.setPen(self.invalid_pen)
-                painter.setFont(self.invalid_font)
-
-        painter.drawText(QRectF(w*self.parent.cell_width, h*self.parent.cell_height,
-                                self.parent.cell_width, self.parent.cell_height), Qt.AlignCenter, str(val))
+        centre_x = (w + 0.5) * self.parent.cell_width
+        centre_y = (h + 0.5) * self.parent.cell_height
+        val = self.sudoku_grid.number_grid.item(h, w)
+        if val:
+            self._draw_glyph(painter, val, self.sudoku_grid.cell_status.item(h, w), centre_x, centre_y)
 
         # Scribbles are drawn as a circle, surrounding the cell digit
-        painter.setPen(self.default_pen)
-        painter.setFont(self.scribble_font)
-        radius = 15
-        for scrib in self.sudoku_grid.scribbles[h, w]:
-            num = int(scrib)
-            num_x = radius * np.sin(np.deg2rad(360/10*num)) + w * self.parent.cell_width
-            num_y = - radius * np.cos(np.deg2rad(360 / 10 * num)) + h * self.parent.cell_height
-            painter.drawText(QRectF(num_x, num_y, self.parent.cell_width, self.parent.cell_height),
-                             Qt.AlignCenter, scrib)
+        for num in self.sudoku_grid.get_cell_scribbles(h, w):
+            dx, dy = SCRIBBLE_OFFSETS[num]
+            self._draw_glyph(painter, num, SCRIBBLE_STYLE, centre_x + dx, centre_y + dy)
 
 
 class SudokuGrid(BaseSudokuItem):
@@ -136,11 +233,30 @@ class SudokuGrid(BaseSudokuItem):
     finishDrawing : Signal()
         Emitted when the drawing animation ends
     puzzleFinished : Signal()
-        Emitted when the puzzle is completed
+        Emitted when the player completes the puzzle
+    puzzleRevealed : Signal()
+        Emitted when the puzzle is completed by auto solving
+    gridChanged : Signal()
+        Emitted when a digit or scribble in the grid is changed by the player
+    hintShown : Signal(str)
+        Emitted when a hint is given. Emits the hint explanation
+    hintReady : Signal(object, object)
+        Emitted from the hint engine's thread when a hint search finishes. Emits the board key and the hint
+    deadEndFound : Signal()
+        Emitted when the board can no longer be completed
+    deadEndResult : Signal(object, int)
+        Emitted from the dead-end detector's thread when a background search finishes.
+        Emits the board key and the result
     """
     buttonClicked = Signal(float, float, bool)
     finishDrawing = Signal()
     puzzleFinished = Signal()
+    puzzleRevealed = Signal()
+    gridChanged = Signal()
+    hintShown = Signal(str)
+    hintReady = Signal(object, object)
+    deadEndFound = Signal()
+    deadEndResult = Signal(object, int)
 
     def __init__(self, width, height, parent=None):
         """Initialise the lines and animation to draw the grid, as well as initialising the
@@ -190,6 +306,11 @@ class SudokuGrid(BaseSudokuItem):
         self.selection_pen.setWidth(self.selection_unit)
         self.selection_box = QRectF(0, 0, self.cell_width, self.cell_height)
 
+        # The fully drawn grid lines, rendered once at the device scale they are shown at
+        self.line_layer = None
+        self.line_layer_scale = None
+
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption, True)
         self.setAcceptHoverEvents(True)
         self.setAcceptedMouseButtons(Qt.LeftButton)
         #self.setFlag(QGraphicsItem.ItemIsFocusable, True)
@@ -209,6 +330,16 @@ class SudokuGrid(BaseSudokuItem):
         self.drawn = False
         self.anim.finished.connect(self.finish_drawing)
 
+        # Hints are searched in the background whenever the digits change
+        self.hint_engine = hints.HintEngine(self.hintReady.emit)
+        self.hintReady.connect(self._receive_hint)
+        self.hint_wanted = False
+        self.hints_used = 0
+
+        # The board is checked for dead ends after every move
+        self.dead_end = deadend.DeadEndDetector(self.deadEndResult.emit)
+        self.deadEndResult.connect(self._receive_dead_end)
+
     def set_disabled(self, state):
         """Disable or Enable the grid to accept inputs
 
@@ -250,8 +381,64 @@ class SudokuGrid(BaseSudokuItem):
         """
         self.sudoku_grid.generate_random_board(difficulty)
         #self.sudoku_grid.generate_test_board(difficulty)   # Uncomment for testing
+        self.hints_used = 0
+        self.dead_end.reset()
+        self.board_changed()
+        self.grid_painter.refresh()
         self.update()
 
+    def board_changed(self, row=None, col=None, prev_val=0):
+        """Restart the hint search for the current digits and check them for a dead end
+
+        Parameters
+        ----------
+        row, col: int
+            The cell that was changed, if it was a single move
+        prev_val: int
+            The digit the cell held before the move
+        """
+        self.hint_wanted = False
+        self.hint_engine.board_changed(self.sudoku_grid.number_grid)
+        if not self.sudoku_grid.conflicting_cells:
+            if self.dead_end.check(self.sudoku_grid.number_grid, row, col, prev_val) == deadend.DEAD:
+                self.deadEndFound.emit()
+
+    def _receive_dead_end(self, key, result):
+        """Report a dead end found by the background search, if the board has not changed since
+        """
+        if result == deadend.DEAD and key == self.dead_end.board_key(self.sudoku_grid.number_grid):
+            self.deadEndFound.emit()
+
+    def show_hint(self):
+        """Give the hint for the current digits, or wait for it if the search has not finished yet
+        """
+        if self.sudoku_grid.conflicting_cells:
+            self.hintShown.emit('Fix the clashing digits first')
+            return
+        ready, hint = self.hint_engine.lookup(self.sudoku_grid.number_grid)
+        if ready:
+            self._display_hint(hint)
+        else:
+            self.hint_wanted = True
+            self.hintShown.emit('Thinking...')
+
+    def _receive_hint(self, key, hint):
+        """Display a finished hint if the player is waiting for it and the board has not changed since
+        """
+        if self.hint_wanted and key == self.hint_engine.board_key(self.sudoku_grid.number_grid):
+            self.hint_wanted = False
+            self._display_hint(hint)
+
+    def _display_hint(self, hint):
+        """Move the selection to the hinted cell and emit the explanation
+        """
+        self.hints_used += 1
+        if hint is None:
+            hint = hints.solution_hint(self.sudoku_grid)
+        if hint is not None:
+            self.move_selection(hint.col, hint.row)
+        self.hintShown.emit(hints.describe_hint(hint))
+
     def change_cell_scribbles(self, val):
         """Change the scribble of a digit of a given cell at the mouse position
 
@@ -264,7 +451,8 @@ class SudokuGrid(BaseSudokuItem):
             self.sudoku_grid.clear_scribble(self.mouse_h, self.mouse_w)
         else:
             self.sudoku_grid.toggle_scribble(self.mouse_h, self.mouse_w, val)
-        self.grid_painter.update()
+        self.grid_painter.refresh()
+        self.gridChanged.emit()
 
     def replace_cell_number(self, val):
         """Replaces the digit in a given cell at the mouse position
@@ -274,10 +462,64 @@ class SudokuGrid(BaseSudokuItem):
         val: int
             The digit for replacing
         """
+        prev_val = self.sudoku_grid.get_cell_number(self.mouse_h, self.mouse_w)
         self.sudoku_grid.replace_cell_number(self.mouse_h, self.mouse_w, val)
-        self.grid_painter.update()
+        self._cell_changed(prev_val)
+
+    def reveal_cell(self):
+        """Fill the cell at the mouse position with its digit from the solution. Counts as a hint.
+        """
+        prev_val = self.sudoku_grid.get_cell_number(self.mouse_h, self.mouse_w)
+        if self.sudoku_grid.reveal_cell(self.mouse_h, self.mouse_w):
+            self.hints_used += 1
+            self._cell_changed(prev_val)
+
+    def _cell_changed(self, prev_val):
+        self.grid_painter.refresh()
         if self.sudoku_grid.completion_check():
             self.puzzleFinished.emit()
+        else:
+            self.gridChanged.emit()
+            self.board_changed(self.mouse_h, self.mouse_w, int(prev_val))
+
+    def auto_solve(self):
+        """Fill the whole grid from the solution, ending the game without a score
+        """
+        status, finished = self.sudoku_grid.auto_solve()
+        self.grid_painter.refresh()
+        if finished:
+            self.puzzleRevealed.emit()
+
+    def toggle_strict(self):
+        """Switch the immediate marking of digits that differ from the solution on or off
+        """
+        self.sudoku_grid.set_strict(not self.sudoku_grid.strict)
+        self.grid_painter.refresh()
+
+    def toggle_auto_candidates(self):
+        """Switch between showing the player's scribbles and the automatic candidates
+        """
+        self.sudoku_grid.set_auto_candidates(not self.sudoku_grid.auto_candidates)
+        self.grid_painter.refresh()
+
+    def undo(self):
+        """Revert the last edit made on the grid
+        """
+        if self.sudoku_grid.undo() is not None:
+            self.grid_painter.refresh()
+            self.gridChanged.emit()
+            self.board_changed()
+
+    def redo(self):
+        """Reapply the last edit reverted on the grid
+        """
+        if self.sudoku_grid.redo() is not None:
+            self.grid_painter.refresh()
+            if self.sudoku_grid.completion_check():
+                self.puzzleFinished.emit()
+            else:
+                self.gridChanged.emit()
+                self.board_changed()
 
     def boundingRect(self):
         """Reimplemented from QGraphicsObject
@@ -286,7 +528,25 @@ class SudokuGrid(BaseSudokuItem):
 
     def paint(self, painter, style, widget=None):
         """Reimplemented from QGraphicsObject. Draws the grid lines and the selection box, which follows the mouse.
+        Once the lines are fully drawn, the exposed part of the cached line layer is copied instead.
         """
+        if self.length == self.width:
+            scale = round(painter.device().devicePixelRatioF() * painter.worldTransform().m11(), 3)
+            if self.line_layer is None or self.line_layer_scale != scale:
+                self._render_line_layer(scale, painter.renderHints())
+            exposed = style.exposedRect
+            bounds = self.boundingRect()
+            source = QRectF((exposed.x() - bounds.x()) * scale, (exposed.y() - bounds.y()) * scale,
+                            exposed.width() * scale, exposed.height() * scale)
+            painter.drawPixmap(exposed, self.line_layer, source)
+        else:
+            self._draw_lines(painter)
+
+        if self.drawn:
+            painter.setPen(self.selection_pen)
+            painter.drawRect(self.selection_box)
+
+    def _draw_lines(self, painter):
         painter.setPen(self.default_pen)
         for line in self.thinlines:
             painter.drawLine(line)
@@ -295,9 +555,41 @@ class SudokuGrid(BaseSudokuItem):
         for line in self.thicklines:
             painter.drawLine(line)
 
-        if self.drawn:
-            painter.setPen(self.selection_pen)
-            painter.drawRect(self.selection_box)
+    def _render_line_layer(self, scale, render_hints):
+        """Render the grid lines into a pixmap covering the bounding rectangle at the given device scale
+        """
+        bounds = self.boundingRect()
+        self.line_layer = QPixmap(math.ceil(bounds.width() * scale), math.ceil(bounds.height() * scale))
+        self.line_layer.setDevicePixelRatio(scale)
+        self.line_layer.fill(Qt.transparent)
+        painter = QPainter(self.line_layer)
+        painter.setRenderHints(render_hints)
+        painter.translate(-bounds.x(), -bounds.y())
+        self._draw_lines(painter)
+        painter.end()
+        self.line_layer_scale = scale
+
+    def selection_rect(self):
+        """Get the area covered by the selection box, including the width of its pen
+        """
+        margin = self.selection_unit / 2 + 1
+        return self.selection_box.adjusted(-margin, -margin, margin, margin)
+
+    def move_selection(self, box_w, box_h):
+        """Move the selection box to a cell, repainting only the area it leaves and the area it enters
+
+        Parameters
+        ----------
+        box_w: int
+            horizontal cell number
+        box_h: int
+            vertical cell number
+        """
+        self.update(self.selection_rect())
+        self.mouse_w = box_w
+        self.mouse_h = box_h
+        self.selection_box.moveTopLeft(QPointF(box_w * self.cell_width, box_h * self.cell_height))
+        self.update(self.selection_rect())
 
     def hoverMoveEvent(self, event):
         """Reimplemented from QGraphicsObject. Updates the mouse grid coordinates as long as the grid is drawn
@@ -307,10 +599,7 @@ class SudokuGrid(BaseSudokuItem):
             box_w = bound_value(0, int(event.pos().x()/self.cell_width), 8)
             box_h = bound_value(0, int(event.pos().y() / self.cell_height), 8)
             if box_w != self.mouse_w or box_h != self.mouse_h:
-                self.mouse_w = box_w
-                self.mouse_h = box_h
-                self.selection_box.moveTopLeft(QPointF(box_w*self.cell_width, box_h*self.cell_height))
-                self.update()
+                self.move_selection(box_w, box_h)
 
     def mousePressEvent(self, event):
         """Reimplemented from QGraphicsObject. May be useless
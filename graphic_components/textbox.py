@@ -4,6 +4,29 @@ from PySide2.QtCore import (QAbstractAnimation, Qt, QPropertyAnimation, Property
 from PySide2.QtGui import QPen
 from PySide2.QtWidgets import QGraphicsObject, QLabel
 
+# Garbage characters are sliced from one pool shared by every animated text, instead of being drawn per frame.
+# The pool is twice NOISE_POOL_SIZE long, so a slice starting anywhere in the first half never runs off the end
+NOISE_POOL_SIZE = 4096
+_noise_pool = ''.join(chr(random.randrange(33, 127)) for _ in range(2 * NOISE_POOL_SIZE))
+# Number of garbage templates kept per label, one of which is picked for each frame
+NOISE_TEMPLATES = 8
+
+
+def noise(length):
+    """Get a string of garbage characters from the shared pool"""
+    if length > NOISE_POOL_SIZE:
+        return (_noise_pool * (length // len(_noise_pool) + 1))[:length]
+    start = random.randrange(NOISE_POOL_SIZE)
+    return _noise_pool[start:start + length]
+
+
+def noise_templates(text, count=NOISE_TEMPLATES):
+    """Get garbage strings as long as text, with the line breaks of text kept in place to retain its paragraphs"""
+    if '\n' not in text:
+        return [noise(len(text)) for _ in range(count)]
+    return [''.join('\n' if char == '\n' else garbage for char, garbage in zip(text, noise(len(text))))
+            for _ in range(count)]
+
 
 class AnimatedText(QGraphicsObject):
 
@@ -62,15 +85,11 @@ class AnimatedText(QGraphicsObject):
         self._shown_length = value
         if value < self.delay:
             # All printed text should be garbage
-            garbage = [chr(num) for num in
-                       [random.choice(range(33, 127)) for _ in range(value)]]
-            self.shown_text = ''.join(garbage)
+            self.shown_text = noise(value)
         else:
             # Printed text contain some actual text
-            garbage = [chr(num) for num in
-                       [random.choice(range(33, 127)) for _ in
-                        range(min(len(self.actual_text) + self.delay - value, self.delay))]]
-            self.shown_text = self.actual_text[:value - self.delay] + ''.join(garbage)
+            self.shown_text = (self.actual_text[:value - self.delay] +
+                               noise(min(len(self.actual_text) + self.delay - value, self.delay)))
 
         self.update()
 
@@ -111,14 +130,8 @@ class AnimatedLabel(QLabel):
         else:
             self.delay = len(self.actual_text)
 
-        # Find out where the new paragraphs are so that it is retained
-        self.splitpoints = []
-        current_point = 0
-        line_splits = self.actual_text.split('\n')
-        for line in line_splits:
-            current_point += len(line)
-            self.splitpoints.append(current_point)
-            current_point += 1
+        # Garbage with the line breaks of the text in place, so that the paragraphs are retained
+        self.templates = noise_templates(self.actual_text)
 
         # Set up the shown text length to be animated
         self.shown_length = 0
@@ -139,7 +152,7 @@ class AnimatedLabel(QLabel):
 
         When the value is set, the text to be printed is generated accordingly.
         It determines whether actual text is to be printed, and retains the
-        paragraphs when printing garbage.
+        paragraphs when printing garbage by slicing it from a template.
         """
         return self._shown_length
 
@@ -147,30 +160,14 @@ class AnimatedLabel(QLabel):
     def shown_length(self, value):
         self._shown_length = value
 
+        template = random.choice(self.templates)
         if value < self.delay:
             # All printed text should be garbage
-            garbage = [chr(num) for num in
-                       [random.choice(range(33, 127)) for _ in range(value)]]
-
-            # Retain the paragraphs
-            for num in self.splitpoints[:-1]:
-                if num < value:
-                    garbage[num] = '\n'
-
-            self.setText(''.join(garbage))
+            self.setText(template[:value])
         else:
-            # Printed text contain some actual text
-            garbage = [chr(num) for num in
-                       [random.choice(range(33, 127)) for _ in
-                        range(min(len(self.actual_text) + self.delay - value, self.delay))]]
-
-            # Retain the paragraphs, but offset by the number of actual text
+            # Printed text contain some actual text, followed by the garbage at the same positions
             non_garbage = value - self.delay
-            for num in self.splitpoints[:-1]:
-                if num - non_garbage > 0 and num < value:
-                    garbage[num - non_garbage] = '\n'
-
-            self.setText(self.actual_text[:value - self.delay] + ''.join(garbage))
+            self.setText(self.actual_text[:non_garbage] + template[non_garbage:min(value, len(self.actual_text))])
 
     def toggle_anim(self, toggling):
         """
@@ -189,8 +186,9 @@ class AnimatedLabel(QLabel):
         self.anim.start()
 
     def replace_text(self, new_text):
-        self.shown_length = 0
         self.actual_text = new_text
+        self.templates = noise_templates(new_text)
+        self.shown_length = 0
         self.anim.setDuration(len(self.actual_text) * self.speed)
         self.anim.setEndValue(len(self.actual_text) + self.delay)
         self.toggle_anim(True)
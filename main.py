@@ -1,13 +1,31 @@
 """This is the main module to be run. Contains the program itself.
 """
+import time
 
-from PySide2.QtGui import QPainter, QBrush
-from PySide2.QtWidgets import QApplication, QGraphicsScene, QGraphicsView, QGraphicsWidget, QGraphicsLinearLayout
-from PySide2.QtCore import Qt
+# Taken before the GUI modules are imported, so that --startup-time includes their import cost
+START_TIME = time.perf_counter()
+
+from PySide2.QtGui import QPainter, QBrush, QKeySequence
+from PySide2.QtWidgets import (QApplication, QGraphicsScene, QGraphicsView, QGraphicsWidget, QGraphicsLinearLayout,
+                               QGraphicsProxyWidget)
+from PySide2.QtCore import Qt, QEvent, QTimer
+import os
 import sys
 
+from gameplay import save_state
 from graphic_components import board
 
+SAVE_FILE = os.path.join(os.getcwd(), 'general', 'savegame.bin')
+
+# This key toggles the automatic candidates
+AUTO_NOTES_KEY = Qt.Key_N
+# This key asks for a hint
+HINT_KEY = Qt.Key_H
+# This key toggles strict mode, marking digits that differ from the solution at once
+STRICT_KEY = Qt.Key_S
+# This key reveals the cell under the mouse. With Shift, it reveals the whole solution
+REVEAL_KEY = Qt.Key_R
+
 
 class SudokuWindow(QGraphicsView):
     """The main window that shows the Sudoku Board and the Menu Board.
@@ -37,15 +55,106 @@ class SudokuWindow(QGraphicsView):
         self.setBackgroundBrush(QBrush(Qt.black))
         self.setRenderHint(QPainter.Antialiasing)
         self.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)
+        if '--eager-scores' in sys.argv:
+            # Read the scores and build the score board up front, as before it was lazy, for a baseline
+            self.menuboard.score_display.get_scoreboard()
         self.show()
 
         # Cross-Board signal connections
         self.gameboard.gridDrawn.connect(lambda: self.menuboard.show_children(True))
         self.gameboard.newGameSelected.connect(self.menuboard.set_difficulty_text)
         self.gameboard.sudokuDone.connect(self.menuboard.finish_the_game)
+        self.gameboard.sudokuRevealed.connect(self.menuboard.stop_the_game)
         self.menuboard.diff_display.menuClicked.connect(self.gameboard.game_unfocus)
         self.menuboard.diff_display.notFocus.connect(lambda: self.gameboard.refocus_timer.start(10))
         self.menuboard.diff_display.difficultySelected.connect(self.gameboard.new_game)
+        self.gameboard.boardChanged.connect(self.menuboard.timer_display.mark_move)
+
+        # Autosave the game in progress, and resume the last one if there is one
+        self.autosaver = save_state.AutoSaver(SAVE_FILE)
+        self.gameboard.newGameSelected.connect(lambda _: self.autosave())
+        self.gameboard.boardChanged.connect(self.autosave)
+        self.gameboard.sudokuDone.connect(lambda *_: self.autosaver.discard())
+        self.gameboard.sudokuRevealed.connect(self.autosaver.discard)
+        self.gameboard.gameResumed.connect(lambda diff: self.menuboard.resume_game(diff, self.resume_time))
+        saved = self.autosaver.load(self.gameboard.gamegrid.sudoku_grid)
+        if saved is not None:
+            self.resume_time, hints_used = saved
+            self.gameboard.resume_game(hints_used)
+
+    def game_in_progress(self):
+        """Check whether there is an unfinished game on the grid
+        """
+        grid = self.gameboard.gamegrid.sudoku_grid
+        return self.gameboard.gamegrid.isVisible() and not grid.is_solved()
+
+    def autosave(self):
+        """Save the game in progress in the background
+        """
+        if self.game_in_progress():
+            grid = self.gameboard.gamegrid.sudoku_grid
+            self.autosaver.submit(save_state.dump_game(grid, self.menuboard.timer_display.get_tenths(),
+                                                       self.gameboard.gamegrid.hints_used))
+
+    def game_has_keys(self):
+        """Check whether the game shortcuts apply: the grid is in play and no text field, such as the high score
+        name entry, has the focus
+        """
+        return not isinstance(self.scene.focusItem(), QGraphicsProxyWidget) and self.gameboard.in_play()
+
+    def handle_game_key(self, event):
+        """Handle the undo, redo, auto notes, hint, strict mode and reveal shortcuts
+
+        Returns
+        -------
+        bool: True if the key was a shortcut
+        """
+        if event.matches(QKeySequence.Undo):
+            self.gameboard.undo_move()
+        elif event.matches(QKeySequence.Redo):
+            self.gameboard.redo_move()
+        elif event.key() == AUTO_NOTES_KEY and not event.isAutoRepeat():
+            self.gameboard.toggle_auto_notes()
+        elif event.key() == HINT_KEY and not event.isAutoRepeat():
+            self.gameboard.show_hint()
+        elif event.key() == STRICT_KEY and not event.isAutoRepeat():
+            self.gameboard.toggle_strict()
+        elif event.key() == REVEAL_KEY and not event.isAutoRepeat():
+            if event.modifiers() & Qt.ShiftModifier:
+                self.gameboard.auto_solve()
+            else:
+                self.gameboard.reveal_cell()
+        else:
+            return False
+        return True
+
+    def keyPressEvent(self, event):
+        """Reimplemented from QGraphicsView. Handle the game shortcuts while the grid is in play, passing every
+        other key on to the scene.
+        """
+        if self.game_has_keys() and self.handle_game_key(event):
+            return
+        super().keyPressEvent(event)
+
+    def closeEvent(self, event):
+        """Reimplemented from QGraphicsView. Save the game in progress and the high scores before closing.
+        """
+        self.autosave()
+        self.autosaver.flush()
+        if '--glyph-report' in sys.argv:
+            print('Glyph cache:', self.gameboard.gamegrid.grid_painter.glyph_cache.report())
+        self.menuboard.score_display.flush_scores()
+        super().closeEvent(event)
+
+    def changeEvent(self, event):
+        """Reimplemented from QGraphicsView. Pause the timer while the window is minimised.
+        """
+        if event.type() == QEvent.WindowStateChange:
+            if self.isMinimized():
+                self.menuboard.timer_display.pause()
+            else:
+                self.menuboard.timer_display.resume()
+        super().changeEvent(event)
 
     def resizeEvent(self, event):
         """Reimplemented from QGraphicsView. Resize and maintain the board aspect ratio.
@@ -59,4 +168,10 @@ if __name__ == "__main__":
     app = QApplication(sys.argv)
 
     ex = SudokuWindow()
+    if '--startup-time' in sys.argv:
+        # Report the time until the event loop has painted the first frame, then quit
+        def report():
+            print('Startup time: {:.1f} ms'.format((time.perf_counter() - START_TIME) * 1000))
+            app.quit()
+        QTimer.singleShot(0, report)
     sys.exit(app.exec_())
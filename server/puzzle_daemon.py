@@ -0,0 +1,392 @@
+"""
+A local daemon that serves Sudoku puzzles, solutions and validations over HTTP, either on a Unix socket
+or on localhost. Puzzles are generated ahead of time in a process pool and kept in a bank of per-difficulty
+pools, so the generation cost is paid once per host instead of once per front-end.
+
+Run from the repository root:
+    python -m server.puzzle_daemon --unix /tmp/sudoku.sock
+    python -m server.puzzle_daemon --port 8765
+
+Endpoints
+---------
+GET  /puzzle?difficulty=<0-4 or name>   -> {"difficulty": int, "puzzle": str}
+POST /solve     {"grid": str}           -> {"solved": bool, "solution": str}
+POST /validate  {"grid": str}           -> {"consistent": bool, "complete": bool, "solvable": bool}
+GET  /metrics                           -> queue depths and latencies
+"""
+
+import argparse
+import asyncio
+import collections
+import contextlib
+import io
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit, parse_qs
+
+from gameplay import Sudoku_Generator as SdkGen
+from gameplay import Sudoku_Solver as solver
+from general.highscore import DIFFICULTIES
+
+POOL_DEPTH = 8
+LATENCY_SAMPLES = 1024
+MAX_BODY = 4096
+# Seconds a puzzle request waits for an empty pool before giving up with 503
+PUZZLE_TIMEOUT = 10.0
+# Seconds to wait after a failed generation, doubled on each failure in a row
+REFILL_BACKOFF = 0.5
+MAX_REFILL_BACKOFF = 30.0
+# Latencies are only recorded for these paths, so unknown paths cannot grow the metrics
+ENDPOINTS = ('/puzzle', '/solve', '/validate', '/metrics')
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+def _init_worker():
+    # Forked workers inherit the parent's random state, which would make them generate the same puzzles
+    random.seed()
+
+
+def generate_puzzle(difficulty):
+    """Generate a puzzle as an 81 character string, keeping the generator quiet. Runs in the process pool."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return SdkGen.array_to_grid(SdkGen.generate_sudoku_puzzle(difficulty))
+
+
+def solve_grid(grid):
+    """Solve an 81 character grid, returning the solution string or an empty string if there is none."""
+    values = solver.solve_grid(grid)
+    if not values:
+        return ''
+    return ''.join(values[s] for s in solver.squares)
+
+
+def validate_grid(grid):
+    """Check a (possibly partially filled) grid against the rules.
+
+    Returns
+    -------
+    dict: whether the filled digits break no rule, whether every cell is filled, and whether a solution exists
+    """
+    values = solver.grid_values(grid)
+    consistent = True
+    for unit in solver.unitlist:
+        filled = [values[s] for s in unit if values[s] in solver.digits]
+        if len(filled) != len(set(filled)):
+            consistent = False
+            break
+    complete = all(d in solver.digits for d in grid)
+    solvable = consistent and bool(solve_grid(grid))
+    return {'consistent': consistent, 'complete': complete, 'solvable': solvable}
+
+
+def parse_difficulty(value):
+    """Accept either the difficulty index or its name, e.g. '2' or 'Normal'."""
+    if value.isdigit():
+        difficulty = int(value)
+    else:
+        names = [d.lower() for d in DIFFICULTIES]
+        if value.lower() not in names:
+            raise ValueError('Unknown difficulty: {}'.format(value))
+        difficulty = names.index(value.lower())
+    if not 0 <= difficulty < len(DIFFICULTIES):
+        raise ValueError('Difficulty out of range: {}'.format(value))
+    return difficulty
+
+
+def parse_grid_string(grid):
+    """Normalise a grid string to 81 characters of '0'-'9', with '.' accepted for empty cells."""
+    if not isinstance(grid, str):
+        raise ValueError('Grid must be a string')
+    grid = grid.replace('.', '0')
+    if len(grid) != 81 or not all(c in '0123456789' for c in grid):
+        raise ValueError('Grid must have 81 digits')
+    return grid
+
+
+class LatencyRecorder:
+    """Keep the count, mean, max and percentiles over a window of recent latencies for one endpoint."""
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = collections.deque(maxlen=samples)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def summary(self):
+        ordered = sorted(self.recent)
+
+        def percentile(p):
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+        return {'count': self.count,
+                'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+                'max_ms': self.max * 1000,
+                'p50_ms': percentile(0.5),
+                'p99_ms': percentile(0.99)}
+
+
+class PuzzleDaemon:
+    """Owns the process pool, the puzzle bank and the HTTP front-end."""
+
+    def __init__(self, pool_depth=POOL_DEPTH, workers=None):
+        """
+        Parameters
+        ----------
+        pool_depth: int
+            Number of ready puzzles to keep per difficulty
+        workers: int
+            Size of the process pool. Defaults to the number of CPUs
+        """
+        self.pool_depth = pool_depth
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        self.generation_slots = None
+        self.pools = []
+        self.refill_tasks = []
+        self.generating = [0] * len(DIFFICULTIES)
+        self.pool_misses = [0] * len(DIFFICULTIES)
+        self.latencies = {path: LatencyRecorder() for path in ENDPOINTS}
+        self.generation_latency = LatencyRecorder()
+        self.started = time.monotonic()
+
+    def start(self):
+        """Create the pools and start refilling them in the background. Must be called within the event loop."""
+        self.pools = [asyncio.Queue(maxsize=self.pool_depth) for _ in DIFFICULTIES]
+        # Leave one worker free so solve and validate requests do not queue behind refills
+        self.generation_slots = asyncio.Semaphore(max(1, self.workers - 1))
+        self.refill_tasks = [asyncio.ensure_future(self._refill(d)) for d in range(len(DIFFICULTIES))]
+
+    async def stop(self):
+        for task in self.refill_tasks:
+            task.cancel()
+        await asyncio.gather(*self.refill_tasks, return_exceptions=True)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _refill(self, difficulty):
+        """Keep one generation running for a difficulty whenever its pool is not full. A failed generation is
+        logged and retried after a growing pause; a broken process pool is replaced.
+        """
+        loop = asyncio.get_running_loop()
+        queue = self.pools[difficulty]
+        backoff = REFILL_BACKOFF
+        while True:
+            async with self.generation_slots:
+                self.generating[difficulty] += 1
+                start = time.perf_counter()
+                executor = self.executor
+                try:
+                    puzzle = await loop.run_in_executor(executor, generate_puzzle, difficulty)
+                except Exception as e:
+                    puzzle = None
+                    print('Generating a {} puzzle failed: {!r}'.format(DIFFICULTIES[difficulty], e))
+                    if isinstance(e, BrokenProcessPool) and executor is self.executor:
+                        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+                        executor.shutdown(wait=False, cancel_futures=True)
+                finally:
+                    self.generating[difficulty] -= 1
+                if puzzle is not None:
+                    self.generation_latency.add(time.perf_counter() - start)
+            if puzzle is None:
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MAX_REFILL_BACKOFF)
+                continue
+            backoff = REFILL_BACKOFF
+            await queue.put(puzzle)
+
+    async def get_puzzle(self, difficulty):
+        """Take a ready puzzle, waiting for one if the pool is empty.
+
+        Raises
+        ------
+        asyncio.TimeoutError: If no puzzle is ready within PUZZLE_TIMEOUT seconds
+        """
+        queue = self.pools[difficulty]
+        if queue.empty():
+            self.pool_misses[difficulty] += 1
+        return await asyncio.wait_for(queue.get(), PUZZLE_TIMEOUT)
+
+    async def run_in_pool(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def metrics(self):
+        return {'uptime_s': time.monotonic() - self.started,
+                'pools': {DIFFICULTIES[d]: {'depth': self.pools[d].qsize(),
+                                            'capacity': self.pool_depth,
+                                            'generating': self.generating[d],
+                                            'misses': self.pool_misses[d]}
+                          for d in range(len(DIFFICULTIES))},
+                'generation': self.generation_latency.summary(),
+                'endpoints': {path: rec.summary() for path, rec in self.latencies.items()}}
+
+    async def dispatch(self, method, target, body):
+        """Route a request to its handler.
+
+        Returns
+        -------
+        (int, dict): The HTTP status and the JSON payload
+        """
+        url = urlsplit(target)
+        path = url.path
+        query = parse_qs(url.query)
+        if path == '/puzzle':
+            if method != 'GET':
+                return 405, {'error': 'Use GET'}
+            difficulty = parse_difficulty(query.get('difficulty', ['1'])[0])
+            try:
+                puzzle = await self.get_puzzle(difficulty)
+            except asyncio.TimeoutError:
+                return 503, {'error': 'No puzzle ready, try again later'}
+            return 200, {'difficulty': difficulty, 'puzzle': puzzle}
+        elif path in ('/solve', '/validate'):
+            if method != 'POST':
+                return 405, {'error': 'Use POST'}
+            grid = parse_grid_string(json.loads(body or b'{}').get('grid'))
+            if path == '/solve':
+                solution = await self.run_in_pool(solve_grid, grid)
+                return 200, {'solved': bool(solution), 'solution': solution}
+            return 200, await self.run_in_pool(validate_grid, grid)
+        elif path == '/metrics':
+            return 200, self.metrics()
+        return 404, {'error': 'Unknown path'}
+
+    async def handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on a connection until the client closes it or asks to."""
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except ValueError as e:
+                    await self._respond(writer, 400, {'error': str(e)}, False)
+                    break
+                if request is None:
+                    break
+                method, target, version, headers, length = request
+
+                keep_alive = (version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close')
+                if length > MAX_BODY:
+                    await self._respond(writer, 413, {'error': 'Body too large'}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                start = time.perf_counter()
+                try:
+                    status, payload = await self.dispatch(method, target, body)
+                except (ValueError, KeyError, AttributeError) as e:
+                    status, payload = 400, {'error': str(e)}
+                except Exception as e:
+                    status, payload = 500, {'error': str(e)}
+                recorder = self.latencies.get(urlsplit(target).path)
+                if recorder is not None:
+                    recorder.add(time.perf_counter() - start)
+
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        """Read a request line and its headers.
+
+        Returns
+        -------
+        (str, str, str, dict, int): The method, target, HTTP version, headers and body length, or None if the
+        client closed the connection
+
+        Raises
+        ------
+        ValueError: If a line is malformed or longer than the stream limit, or the Content-Length is invalid
+        """
+        try:
+            request_line = await reader.readline()
+        except ValueError:
+            raise ValueError('Request line too long')
+        if not request_line:
+            return None
+        try:
+            method, target, version = request_line.decode('latin-1').split()
+        except ValueError:
+            raise ValueError('Malformed request line')
+
+        headers = {}
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                raise ValueError('Header line too long')
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length', '0'))
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise ValueError('Invalid Content-Length')
+        return method, target, version, headers, length
+
+    @staticmethod
+    async def _respond(writer, status, payload, keep_alive):
+        data = json.dumps(payload).encode()
+        head = ('HTTP/1.1 {} {}\r\n'
+                'Content-Type: application/json\r\n'
+                'Content-Length: {}\r\n'
+                'Connection: {}\r\n\r\n').format(status, HTTP_REASONS.get(status, ''), len(data),
+                                                 'keep-alive' if keep_alive else 'close')
+        writer.write(head.encode('latin-1') + data)
+        await writer.drain()
+
+
+async def serve(unix_path=None, host='127.0.0.1', port=8765, pool_depth=POOL_DEPTH, workers=None):
+    daemon = PuzzleDaemon(pool_depth, workers)
+    daemon.start()
+    if unix_path:
+        if os.path.exists(unix_path):
+            os.remove(unix_path)
+        server = await asyncio.start_unix_server(daemon.handle_connection, path=unix_path)
+        print('Serving puzzles on unix socket', unix_path)
+    else:
+        server = await asyncio.start_server(daemon.handle_connection, host, port)
+        print('Serving puzzles on http://{}:{}'.format(host, port))
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await daemon.stop()
+        if unix_path and os.path.exists(unix_path):
+            os.remove(unix_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve Sudoku puzzles to local front-ends.')
+    parser.add_argument('--unix', help='Path of the Unix socket to listen on, instead of TCP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--depth', type=int, default=POOL_DEPTH, help='Ready puzzles kept per difficulty')
+    parser.add_argument('--workers', type=int, default=None, help='Size of the generation process pool')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.unix, args.host, args.port, args.depth, args.workers))
+    except KeyboardInterrupt:
+        pass
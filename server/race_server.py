@@ -0,0 +1,487 @@
+"""
+A race mode server: every player in a race gets the same puzzle, moves are validated on the server with the
+gameplay rules, and the players' progress is broadcast to the whole race.
+
+All boards live in one SessionStore, so a player costs a slot of its preallocated arrays plus a bounded
+outgoing queue. A client that falls MAX_NOTICES undroppable messages behind is disconnected. Progress is
+coalesced and broadcast a few times a second rather than once per move, so the broadcast cost does not grow
+with the square of the number of players.
+
+The protocol is line-delimited JSON over TCP on localhost.
+
+Client -> server
+----------------
+{"op": "join", "name": str}
+{"op": "move", "row": int, "col": int, "value": int, "seq": int}     value 0 erases
+{"op": "stats"}
+{"op": "leave"}
+
+Server -> client
+----------------
+{"op": "joined", "player": int, "race": int, "puzzle": str}
+{"op": "ack", "seq": int, "ok": bool, "status": int, "filled": int}  ok is false for a given cell
+{"op": "progress", "players": [[player, filled, conflicting], ...]}
+{"op": "finished", "player": int, "place": int, "seconds": float}
+{"op": "stats", ...}
+{"op": "error", "error": str}
+
+Run from the repository root:
+    python -m server.race_server --port 8766
+    python -m server.race_server --load 500            # server and 500 scripted clients in one process
+    python -m server.race_server --load 500 --connect  # scripted clients against a running server
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import random
+import time
+
+from gameplay import async_api
+from gameplay import Sudoku_Generator as SdkGen
+from gameplay import Sudoku_Solver as solver
+from gameplay.session_store import SessionStore, SessionStoreFull
+
+MAX_LINE = 1024
+OUTBOX_SIZE = 64
+# Messages held back for a client whose outbox is full, beyond which the client is disconnected
+MAX_NOTICES = 64
+BROADCAST_INTERVAL = 0.2
+HISTOGRAM_BUCKETS = 32
+
+
+def encode(message):
+    return json.dumps(message, separators=(',', ':')).encode() + b'\n'
+
+
+class LatencyHistogram:
+    """Count latencies in power of two buckets of microseconds. Bucket b holds latencies below 2**b us."""
+
+    def __init__(self):
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        us = int(seconds * 1e6)
+        self.buckets[min(us.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        """Get the upper bound, in microseconds, of the bucket holding the p-th percentile"""
+        target = p * self.count
+        seen = 0
+        for b, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= target:
+                return 1 << b
+        return 0
+
+    def summary(self):
+        return {'count': self.count,
+                'mean_us': self.total / self.count * 1e6 if self.count else 0.0,
+                'max_us': self.max * 1e6,
+                'p50_us': self.percentile(0.5),
+                'p99_us': self.percentile(0.99),
+                'buckets_us': {'<{}'.format(1 << b): n for b, n in enumerate(self.buckets) if n}}
+
+
+class Player:
+
+    def __init__(self, player_id, name, session):
+        self.id = player_id
+        self.name = name
+        self.session = session
+        self.race = None
+        self.outbox = asyncio.Queue(maxsize=OUTBOX_SIZE)
+        # Messages that must reach the client but did not fit in the outbox, oldest first
+        self.notices = collections.deque()
+        self.finished = False
+        # The connection's writer and handler task, set once joined
+        self.writer = None
+        self.task = None
+        self.disconnected = False
+
+    def offer(self, data):
+        """Queue a message that a later one supersedes, dropping it if the client is behind"""
+        try:
+            self.outbox.put_nowait(data)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def notify(self, data):
+        """Queue a message that must not be dropped, holding it back until the outbox has room. A client with
+        MAX_NOTICES messages held back is disconnected instead, so its memory stays bounded.
+
+        Returns
+        -------
+        bool: True if it had to be held back
+        """
+        if self.disconnected:
+            return False
+        if len(self.notices) >= MAX_NOTICES:
+            self.disconnect()
+            return False
+        self.notices.append(data)
+        return not self.flush_notices()
+
+    def disconnect(self):
+        self.disconnected = True
+        self.notices.clear()
+        if self.writer is not None:
+            self.writer.close()
+        if self.task is not None:
+            # The handler may be waiting for room in the outbox, so it is cancelled rather than left to notice
+            self.task.cancel()
+
+    def flush_notices(self):
+        """Move held back messages into the outbox while there is room
+
+        Returns
+        -------
+        bool: True if none are left
+        """
+        while self.notices and self.offer(self.notices[0]):
+            self.notices.popleft()
+        return not self.notices
+
+
+class Race:
+
+    def __init__(self, race_id, puzzle):
+        self.id = race_id
+        self.puzzle = puzzle
+        self.puzzle_string = SdkGen.array_to_grid(puzzle)
+        self.players = {}
+        self.dirty = set()
+        self.places = 0
+        self.started = time.monotonic()
+
+    def is_over(self):
+        """A race is over once someone has finished and nobody is still playing"""
+        return self.places > 0 and all(p.finished for p in self.players.values())
+
+
+class RaceServer:
+    """Owns the session store, the current race and the broadcast loop."""
+
+    def __init__(self, difficulty=1, capacity=4096, interval=BROADCAST_INTERVAL):
+        """
+        Parameters
+        ----------
+        difficulty: int
+            Difficulty of the race puzzles
+        capacity: int
+            Maximum number of players connected at once
+        interval: float
+            Seconds between progress broadcasts
+        """
+        self.difficulty = difficulty
+        self.interval = interval
+        self.store = SessionStore(capacity)
+        self.race = None
+        self.races = 0
+        self.players = 0
+        self.move_latency = LatencyHistogram()
+        self.dropped = 0
+        self.slow_disconnects = 0
+        # Players with messages held back until their outbox has room
+        self.behind = set()
+        self._race_lock = None
+        self._broadcaster = None
+
+    def start(self):
+        """Start broadcasting progress. Must be called within the event loop."""
+        self._race_lock = asyncio.Lock()
+        self._broadcaster = asyncio.ensure_future(self._broadcast_loop())
+
+    async def stop(self):
+        if self._broadcaster is not None:
+            self._broadcaster.cancel()
+            await asyncio.gather(self._broadcaster, return_exceptions=True)
+
+    async def current_race(self):
+        """Get the race to join, starting one with a new puzzle if there is none or the last one is over"""
+        async with self._race_lock:
+            if self.race is None or self.race.is_over():
+                puzzle = await async_api.generate_sudoku_puzzle(self.difficulty)
+                self.races += 1
+                self.race = Race(self.races, puzzle)
+            return self.race
+
+    def stats(self):
+        return {'op': 'stats',
+                'players': len(self.store),
+                'race': self.race.id if self.race else None,
+                'dropped_broadcasts': self.dropped,
+                'slow_disconnects': self.slow_disconnects,
+                'move_latency': self.move_latency.summary()}
+
+    async def join(self, name):
+        race = await self.current_race()
+        session = self.store.create(race.puzzle)
+        self.players += 1
+        player = Player(self.players, name, session)
+        player.race = race
+        race.players[player.id] = player
+        race.dirty.add(player.id)
+        return player
+
+    def leave(self, player):
+        race = player.race
+        if race is not None:
+            race.players.pop(player.id, None)
+            race.dirty.discard(player.id)
+            player.race = None
+        self.behind.discard(player)
+        if player.session in self.store:
+            self.store.evict(player.session)
+
+    def move(self, player, message):
+        """Validate and apply a move.
+
+        Returns
+        -------
+        dict: The acknowledgement
+        """
+        row, col, val = int(message['row']), int(message['col']), int(message['value'])
+        session = player.session
+        ok = self.store.apply_move(session, row, col, val)
+        slot = self.store.slot_of(session)
+        race = player.race
+        race.dirty.add(player.id)
+        if ok and not player.finished and self.store.is_finished(session):
+            player.finished = True
+            race.places += 1
+            self._notify_all(race, encode({'op': 'finished', 'player': player.id, 'place': race.places,
+                                           'seconds': round(time.monotonic() - race.started, 3)}))
+        return {'op': 'ack', 'seq': message.get('seq'), 'ok': ok,
+                'status': self.store.status.item(slot, row * 9 + col),
+                'filled': self.store.filled.item(slot)}
+
+    def _send_all(self, race, data):
+        for player in race.players.values():
+            if not player.offer(data):
+                self.dropped += 1
+
+    def _notify_all(self, race, data):
+        for player in list(race.players.values()):
+            was_connected = not player.disconnected
+            if player.notify(data):
+                self.behind.add(player)
+            elif was_connected and player.disconnected:
+                self.slow_disconnects += 1
+
+    async def _broadcast_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.behind = {player for player in self.behind
+                           if not player.disconnected and not player.flush_notices()}
+            race = self.race
+            if race is None or not race.dirty:
+                continue
+            changed = [race.players[p] for p in race.dirty if p in race.players]
+            race.dirty.clear()
+            if not changed:
+                continue
+            slots = [self.store.slot_of(p.session) for p in changed]
+            filled = self.store.filled[slots].tolist()
+            conflicting = self.store.conflicting[slots].tolist()
+            self._send_all(race, encode({'op': 'progress',
+                                         'players': [[p.id, f, c] for p, f, c in
+                                                     zip(changed, filled, conflicting)]}))
+
+    async def handle_connection(self, reader, writer):
+        player = None
+        sender = None
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Line longer than the stream limit
+                    writer.write(encode({'op': 'error', 'error': 'Line too long'}))
+                    break
+                if not line:
+                    break
+                start = time.perf_counter()
+                try:
+                    message = json.loads(line)
+                    op = message['op']
+                    if op == 'move':
+                        if player is None:
+                            raise ValueError('Join a race first')
+                        reply = self.move(player, message)
+                        self.move_latency.add(time.perf_counter() - start)
+                    elif op == 'join':
+                        if player is not None:
+                            raise ValueError('Already in a race')
+                        try:
+                            player = await self.join(str(message.get('name', ''))[:32])
+                        except SessionStoreFull:
+                            raise ValueError('The server is full')
+                        player.writer = writer
+                        player.task = asyncio.current_task()
+                        sender = asyncio.ensure_future(self._send_loop(player, writer))
+                        reply = {'op': 'joined', 'player': player.id, 'race': player.race.id,
+                                 'puzzle': player.race.puzzle_string}
+                    elif op == 'stats':
+                        reply = self.stats()
+                    elif op == 'leave':
+                        break
+                    else:
+                        raise ValueError('Unknown op: {}'.format(op))
+                except (ValueError, KeyError, TypeError) as e:
+                    reply = {'op': 'error', 'error': str(e)}
+
+                if player is None:
+                    writer.write(encode(reply))
+                    await writer.drain()
+                else:
+                    # Waiting for room in the outbox stops reading from a client that does not read its replies
+                    await player.outbox.put(encode(reply))
+        except ConnectionError:
+            pass
+        except asyncio.CancelledError:
+            if player is None or not player.disconnected:
+                raise
+        finally:
+            if player is not None:
+                self.leave(player)
+            if sender is not None:
+                sender.cancel()
+                await asyncio.gather(sender, return_exceptions=True)
+            writer.close()
+
+    @staticmethod
+    async def _send_loop(player, writer):
+        while True:
+            data = await player.outbox.get()
+            writer.write(data)
+            await writer.drain()
+
+
+async def serve(host='127.0.0.1', port=8766, difficulty=1, capacity=4096, interval=BROADCAST_INTERVAL):
+    server = RaceServer(difficulty, capacity, interval)
+    server.start()
+    listener = await asyncio.start_server(server.handle_connection, host, port, limit=MAX_LINE)
+    return server, listener
+
+
+async def scripted_client(host, port, mistake_rate, rng, latency, solutions):
+    """Join a race and play its solution in a random order, sometimes entering a wrong digit first.
+
+    Returns
+    -------
+    int: The number of moves played
+    """
+    reader, writer = await asyncio.open_connection(host, port, limit=1 << 20)
+
+    async def read_reply(op):
+        while True:
+            message = json.loads(await reader.readline())
+            if message['op'] in (op, 'error'):
+                return message
+
+    writer.write(encode({'op': 'join', 'name': 'bot'}))
+    joined = await read_reply('joined')
+    puzzle = joined['puzzle']
+    if puzzle not in solutions:
+        values = solver.solve_grid(puzzle)
+        solutions[puzzle] = [int(values[s]) for s in solver.squares]
+    solution = solutions[puzzle]
+
+    moves = []
+    for i in rng.sample([i for i, c in enumerate(puzzle) if c == '0'], puzzle.count('0')):
+        if rng.random() < mistake_rate:
+            moves.append((i, rng.choice([d for d in range(1, 10) if d != solution[i]])))
+        moves.append((i, solution[i]))
+
+    for seq, (i, val) in enumerate(moves):
+        start = time.perf_counter()
+        writer.write(encode({'op': 'move', 'row': i // 9, 'col': i % 9, 'value': val, 'seq': seq}))
+        await read_reply('ack')
+        latency.add(time.perf_counter() - start)
+
+    writer.write(encode({'op': 'leave'}))
+    writer.close()
+    return len(moves)
+
+
+async def run_load(host, port, clients, mistake_rate=0.1, seed=None, connect=False, difficulty=1):
+    """Run scripted clients against a server, starting one in this process unless connect is set.
+
+    Returns
+    -------
+    dict: Throughput and the client round trip and server validation latencies
+    """
+    server = listener = None
+    if not connect:
+        server, listener = await serve(host, port, difficulty, max(clients, 1))
+    rng = random.Random(seed)
+    latency = LatencyHistogram()
+    solutions = {}
+
+    start = time.perf_counter()
+    counts = await asyncio.gather(*(scripted_client(host, port, mistake_rate, random.Random(rng.random()),
+                                                    latency, solutions)
+                                    for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    result = {'clients': clients,
+              'moves': sum(counts),
+              'seconds': elapsed,
+              'moves_per_second': sum(counts) / elapsed if elapsed else float('inf'),
+              'round_trip': latency.summary()}
+    if server is not None:
+        result['server'] = server.stats()
+        listener.close()
+        await listener.wait_closed()
+        await server.stop()
+    return result
+
+
+async def main(args):
+    if args.load:
+        result = await run_load(args.host, args.port, args.load, args.mistakes, args.seed, args.connect,
+                                args.difficulty)
+        print(json.dumps(result, indent=2))
+        return
+    server, listener = await serve(args.host, args.port, args.difficulty, args.capacity)
+    print('Racing on {}:{}'.format(args.host, args.port))
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.stop()
+        print(json.dumps(server.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve Sudoku races, or load test a race server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--difficulty', type=int, default=1)
+    parser.add_argument('--capacity', type=int, default=4096, help='Maximum number of players at once')
+    parser.add_argument('--load', type=int, default=0, help='Run this many scripted clients')
+    parser.add_argument('--connect', action='store_true', help='Load test a server that is already running')
+    parser.add_argument('--mistakes', type=float, default=0.1, help='Share of cells first filled wrongly')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass